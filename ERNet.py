@@ -0,0 +1,80 @@
+"""
+Array-native Erdos-Renyi network for Ultimatum Game in complex network
+"""
+
+import numpy as np
+
+import csr_engine
+
+
+def pair_index(idx):
+    '''
+    node pair (i, j), j < i, of every position in the row-major lower triangle
+    '''
+    i = np.floor((1 + np.sqrt(1 + 8*idx.astype(np.float64)))/2).astype(np.int64)
+    # float sqrt can be one off near row boundaries
+    i -= i*(i-1)//2 > idx
+    i += (i+1)*i//2 <= idx
+    return i,idx - i*(i-1)//2
+
+
+def gnp_edges(node_num,p):
+    '''
+    edges of G(n,p), the same model as nx.erdos_renyi_graph, in O(n + m):
+    geometric skips between the chosen pairs of the lower triangle,
+    edges come out grouped by their larger end node, as int32 node ids when they fit
+    '''
+    total = node_num*(node_num-1)//2
+    node_dtype = np.int32 if node_num < 2**31 else np.int64
+    if p <= 0 or total == 0:
+        return np.zeros(0,dtype = node_dtype),np.zeros(0,dtype = node_dtype)
+    if p >= 1:
+        i,j = pair_index(np.arange(total,dtype = np.int64))
+        return i.astype(node_dtype),j.astype(node_dtype)
+    src = []
+    dst = []
+    last = -1
+    while last < total:
+        expected = (total-last)*p
+        size = int(min(expected + 5*np.sqrt(expected),2**24)) + 16
+        idx = last + np.cumsum(np.random.geometric(p,size))
+        last = idx[-1]
+        i,j = pair_index(idx[idx < total])
+        src.append(i.astype(node_dtype))
+        dst.append(j.astype(node_dtype))
+    return np.concatenate(src),np.concatenate(dst)
+
+
+def repair_isolated(src,dst,node_num):
+    '''
+    connect every zero-degree node to a uniformly chosen other node, in one pass.
+    as in build_network, nodes are repaired in node order and a node already
+    chosen by an earlier repaired node is no longer isolated and is skipped
+    '''
+    degree = np.bincount(src,minlength = node_num) + np.bincount(dst,minlength = node_num)
+    isolated = np.nonzero(degree == 0)[0]
+    if isolated.size == 0 or node_num < 2:
+        return src,dst
+    nbr = np.random.randint(0,node_num-1,isolated.size)
+    nbr += nbr >= isolated
+    repaired = np.ones(isolated.size,dtype = bool)
+    first_chooser = np.full(node_num,node_num,dtype = np.int64)
+    while True:
+        first_chooser[:] = node_num
+        np.minimum.at(first_chooser,nbr[repaired],isolated[repaired])
+        # skipping a node can un-skip a later one, repeat until nothing changes
+        now_repaired = first_chooser[isolated] > isolated
+        if np.array_equal(now_repaired,repaired):
+            break
+        repaired = now_repaired
+    return (np.concatenate([src,isolated[repaired].astype(src.dtype)]),
+            np.concatenate([dst,nbr[repaired].astype(dst.dtype)]))
+
+
+def erdos_renyi_csr(node_num,p):
+    '''
+    ER network with isolated nodes repaired, as CSR arrays (indptr, indices)
+    '''
+    src,dst = gnp_edges(node_num,p)
+    src,dst = repair_isolated(src,dst,node_num)
+    return csr_engine.edges_to_csr(src,dst,node_num)
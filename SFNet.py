@@ -7,8 +7,11 @@ import os
 
 import networkx as nx
 import matplotlib.pyplot as plt
+import numpy as np
 import random
 
+import csr_engine
+
 #总的节点数
 node_num = 2000
 #初始节点数
@@ -77,27 +80,117 @@ def barabasi_albert_graph(n, m_0):
 	#返回所得的图G
 	return G
 
-# G = barabasi_albert_graph(node_num , m_0)
-# G = nx.random_graphs.barabasi_albert_graph(node_num, 2)
-G = nx.random_graphs.erdos_renyi_graph(node_num, 4.0/node_num)
-
-degree_total = 0
-for x in range(len(G.degree())):
-	degree_total = degree_total + G.degree(x)
-
-print('平均连接度为：',degree_total/node_num)
-# print(nx.average_neighbor_degree(G))
-ps=nx.spring_layout(G)  #布置框架  
-nx.draw(G , ps, with_labels=False, node_size=30)  
-plt.show()
-
-#返回图中所有节点的度分布序列
-degree = nx.degree_histogram(G)
-#生成x轴序列，从1到最大度
-x = range(len(degree))
-#将频次转换为频率，这用到Python的一个小技巧：列表内涵，Python的确很方便：）           
-y = [z / float(sum(degree)) for z in degree]
-#在双对数坐标轴上绘制度分布曲线
-plt.loglog(x, y, color="blue", linewidth=2)
-#显示图表       
-plt.show()
\ No newline at end of file
+def edge_counts(seq, size):
+	# random_choice 的批量版本: 一次抽取 size 个连接数
+	cum = np.cumsum(seq)
+	return np.searchsorted(cum, np.random.rand(size)*cum[-1], side = 'right') + 1
+
+def barabasi_albert_csr(n, m_0 = m_0, seq = p):
+	"""
+	和 barabasi_albert_graph 相同的模型 (repeated_nodes 优先连接, 连接数按 seq 分布),
+	直接返回 CSR 数组 (indptr, indices), 随机数批量抽取, 复杂度 O(N·m)。
+	第 t 个源点在 repeated_nodes 的前 L_t 个位置中均匀抽取候选位置,
+	位置上要么是源点 (已知), 要么是更早一步的目标, 所以按轮次解出:
+	每一轮处理候选位置都已确定的步。某一步抽到重复节点时, 给这一步追加候选位置,
+	取前 edge 个不同的节点, 与逐个拒绝重复的 while 循环同分布。
+	"""
+	# 初始阶段: 源点依次不放回地连接 m_0 个初始节点
+	init_edge = edge_counts(seq, m_0)
+	init_steps = int(np.searchsorted(np.cumsum(init_edge), m_0)) + 1
+	init_edge = init_edge[:init_steps]
+	init_targets = np.diff(np.minimum(np.cumsum(init_edge), m_0), prepend = 0)
+	init_start = np.cumsum(init_targets) - init_targets
+	init_source = np.arange(m_0, m_0 + init_steps)
+	perm = np.random.permutation(m_0)
+	# repeated_nodes 初始部分: 每步先是目标, 再是 edge 个源点 (初始阶段最多 m_0 步)
+	init_repeated = []
+	for i in range(init_steps):
+		init_repeated.extend(perm[init_start[i]:init_start[i] + init_targets[i]])
+		init_repeated.extend([init_source[i]] * init_edge[i])
+
+	# 主体阶段, 第 t 步抽取时 repeated_nodes 的长度为 length[t]
+	node_num = max(n, m_0 + init_steps)
+	source = np.arange(m_0 + init_steps, node_num)
+	T = source.size
+	edge = edge_counts(seq, T)
+	edge_start = np.cumsum(edge) - edge
+	length = len(init_repeated) + 2*edge_start
+	# 第 t 步之前共有 m_0 + init_steps + t 个不同节点, 连接数超过它时无法取到不同的目标
+	if np.any(edge > m_0 + init_steps + np.arange(T)):
+		raise ValueError("seq allows {} edges per step, more than the {} nodes of the initial phase, raise m_0".format(
+			len(seq), m_0 + init_steps))
+	E = int(edge.sum())
+	target_slot = np.repeat(length, edge) + np.arange(E) - np.repeat(edge_start, edge)
+	value = np.full(len(init_repeated) + 2*E, -1, dtype = np.int64)
+	value[:len(init_repeated)] = init_repeated
+	value[target_slot + np.repeat(edge, edge)] = np.repeat(source, edge)
+
+	m_max = len(seq)
+	used = np.arange(m_max) < edge[:, None]
+	# 没用到的候选指向位置 0 (初始节点, 已确定)
+	cand = (np.random.rand(T, m_max)*length[:, None]).astype(np.int64)*used
+	extra = {} # 抽到重复节点的步: 追加的候选位置
+	pending = np.arange(T)
+	while pending.size:
+		cand_node = value[cand[pending]]
+		ready = (cand_node >= 0).all(axis = 1)
+		dup = np.zeros(pending.size, dtype = bool)
+		for i in range(1, m_max):
+			for j in range(i):
+				dup |= used[pending, i] & (cand_node[:, i] == cand_node[:, j])
+		done = ready & ~dup
+		t = pending[done]
+		slot = length[t][:, None] + np.arange(m_max)
+		value[slot[used[t]]] = cand_node[done][used[t]]
+		deferred = []
+		for t in pending[ready & dup].tolist():
+			positions = cand[t, :edge[t]].tolist() + extra.get(t, [])
+			targets = []
+			k = 0
+			while len(targets) < edge[t]:
+				if k == len(positions):
+					more = (np.random.rand(4)*length[t]).astype(np.int64).tolist()
+					extra[t] = extra.get(t, []) + more
+					positions += more
+				x = value[positions[k]]
+				if x < 0:
+					break
+				if x not in targets:
+					targets.append(x)
+				k += 1
+			if len(targets) < edge[t]:
+				deferred.append(t)
+			else:
+				value[length[t]:length[t] + edge[t]] = targets
+		pending = np.concatenate([pending[~ready], np.array(deferred, dtype = np.int64)])
+
+	src = np.concatenate([np.repeat(init_source, init_targets), np.repeat(source, edge)])
+	dst = np.concatenate([perm, value[target_slot]])
+	# 每个节点的邻居: 先是它作为源点连接的目标, 再是连接到它的源点
+	return csr_engine.edges_to_csr(src, dst, node_num)
+
+if __name__ == '__main__':
+	# G = barabasi_albert_graph(node_num , m_0)
+	# G = nx.random_graphs.barabasi_albert_graph(node_num, 2)
+	G = nx.random_graphs.erdos_renyi_graph(node_num, 4.0/node_num)
+
+	degree_total = 0
+	for x in range(len(G.degree())):
+		degree_total = degree_total + G.degree(x)
+
+	print('平均连接度为：',degree_total/node_num)
+	# print(nx.average_neighbor_degree(G))
+	ps=nx.spring_layout(G)  #布置框架  
+	nx.draw(G , ps, with_labels=False, node_size=30)  
+	plt.show()
+
+	#返回图中所有节点的度分布序列
+	degree = nx.degree_histogram(G)
+	#生成x轴序列，从1到最大度
+	x = range(len(degree))
+	#将频次转换为频率，这用到Python的一个小技巧：列表内涵，Python的确很方便：）           
+	y = [z / float(sum(degree)) for z in degree]
+	#在双对数坐标轴上绘制度分布曲线
+	plt.loglog(x, y, color="blue", linewidth=2)
+	#显示图表       
+	plt.show()
\ No newline at end of file
@@ -8,16 +8,182 @@ import os
 import networkx as nx
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import time
 
+import checkpoint
+import convergence
+import counter_rng
+import csr_engine
+import ERNet
+import incremental
+import kernels
+import pq_stats
+import profiler
+import seeding
+import SFNet
+import sharded
+import stats_log
+import threaded
+from graph_cache import GraphCache
+
+# option groups of UG_Complex_Network, a group is a dict holding some of these keys
+engine_defaults = {
+    'ns_mode': "sync", # "sync" or "seq", natural selection of the array engines
+    'incremental': False, # recompute only changed payoffs, array engines
+    'dirty_threshold': 0.25, # fraction of recomputed nodes above which incremental play sweeps all edges
+    'replicas': None, # independent populations on one graph, array engines
+    'compact': False, # float32 p/q/payoff and int32 node ids, array engines
+    'threads': None, # pool size of the threads engine, None uses every core
+    'shards': None, # worker processes of the sharded engine, None uses every core
+}
+graph_defaults = {
+    'generator': "nx", # "nx" or "array", array builds the CSR topology without networkx
+    'graph_cache': None, # directory (or GraphCache) of built networks, keyed by the generator parameters and graph_seed
+    'graph_seed': None, # seeds random and np.random while the network is built
+    'topology': None, # prebuilt CSRNetwork arrays (indptr, indices, degree, src), e.g. attached shared memory
+}
+io_defaults = {
+    'save_format': "npy", # "npy" binary check points, yaml graph dumps are gone with nx.write_yaml
+    'save_dtype': "float64", # "float64" or "float32" for npy snapshots
+    'async_save': False, # write check points on a background thread
+    'max_pending': 2, # check points waiting for the background writer
+    'log_stats': False, # per-epoch p/q statistics in result/<run>/stats
+    'quantile_interval': 100, # p/q quantiles of the log every quantile_interval epochs, NaN in between, None never
+}
+seed_defaults = {
+    'rng': "global", # "global" draws from np.random, "philox" from counters keyed by (seed, epoch, purpose, node)
+    'seed': None, # root of the graph, strategy and dynamics streams
+    'spawn_key': (), # child of seed, e.g. the run index of a sweep
+}
+
+
+def options(given,defaults,group):
+    '''
+    defaults updated with the given dict, and the names of the options set to other values.
+    unknown names are an error
+    '''
+    given = dict(given or {})
+    unknown = sorted(set(given) - set(defaults))
+    if unknown:
+        raise ValueError("unknown {}: {}".format(group,", ".join(unknown)))
+    if isinstance(given.get('spawn_key'),int):
+        given['spawn_key'] = (given['spawn_key'],)
+    elif 'spawn_key' in given:
+        given['spawn_key'] = tuple(given['spawn_key'])
+    changed = {name for name,value in given.items() if not is_default(value,defaults[name])}
+    return dict(defaults,**given),changed
+
+
+def is_default(value,default):
+    if value is default:
+        return True
+    # False is not 0 and a dict is never a default, so compare only values of the default's own type
+    return default is not None and type(value) is type(default) and value == default
+
+
+def check_options(engine,engine_opts,graph_opts,io_opts,seed_opts,changed):
+    '''
+    reject combinations that would be silently ignored or cannot run
+    '''
+    if engine not in ("nx","csr","numba","threads","sharded"):
+        raise ValueError("unknown engine: {}".format(engine))
+    if engine_opts['ns_mode'] not in ("sync","seq"):
+        raise ValueError("ns_mode must be \"sync\" or \"seq\"")
+    if io_opts['save_format'] != "npy":
+        raise ValueError("save_format must be \"npy\", yaml graph dumps need nx.write_yaml, removed in networkx 3.0")
+    if seed_opts['rng'] not in ("global","philox"):
+        raise ValueError("rng must be \"global\" or \"philox\"")
+    rules = [
+        (engine == "nx",{'ns_mode','incremental','dirty_threshold','replicas','compact'},"needs an array engine"),
+        (engine != "threads",{'threads'},"only applies to engine \"threads\""),
+        (engine != "sharded",{'shards'},"only applies to engine \"sharded\""),
+        (engine == "sharded",{'replicas','incremental','ns_mode'},"not supported by the sharded engine (one population, synchronous updates)"),
+        ('replicas' in changed,{'incremental','ns_mode'},"not supported with replicas (synchronous, non-incremental updates)"),
+        (not engine_opts['incremental'],{'dirty_threshold'},"only applies with incremental"),
+        (graph_opts['topology'] is not None,{'generator','graph_cache','graph_seed'},"does not apply to a prebuilt topology"),
+        (not io_opts['async_save'],{'max_pending'},"only applies with async_save"),
+        (not io_opts['log_stats'],{'quantile_interval'},"only applies with log_stats"),
+        (seed_opts['seed'] is None,{'spawn_key'},"needs a seed"),
+        (seed_opts['seed'] is not None,{'graph_seed'},"conflicts with seed, which derives the graph seed"),
+    ]
+    for applies,names,reason in rules:
+        conflict = sorted(names & changed)
+        if applies and conflict:
+            raise ValueError("{}: {}".format(", ".join(conflict),reason))
+    if graph_opts['graph_cache'] is not None and graph_opts['graph_seed'] is None and seed_opts['seed'] is None:
+        raise ValueError("graph_cache needs a graph_seed or a seed")
+
+
 class UG_Complex_Network():
-    def __init__(self,node_num = 10000,network_type = "SF",update_rule ="NS",player_type = "B",avg_degree = 4,check_point = None):
+    def __init__(self,node_num = 10000,network_type = "SF",update_rule ="NS",player_type = "B",avg_degree = 4,check_point = None,engine = "nx",
+                 engine_options = None,graph_options = None,io_options = None,seed_options = None,early_stop = None,profile = None):
+        '''
+        engine_options, graph_options, io_options and seed_options are dicts holding
+        some of the keys of engine_defaults, graph_defaults, io_defaults and seed_defaults
+        '''
+        engine_opts,changed = options(engine_options,engine_defaults,"engine_options")
+        graph_opts,graph_changed = options(graph_options,graph_defaults,"graph_options")
+        io_opts,io_changed = options(io_options,io_defaults,"io_options")
+        seed_opts,seed_changed = options(seed_options,seed_defaults,"seed_options")
+        changed |= graph_changed | io_changed | seed_changed
+        check_options(engine,engine_opts,graph_opts,io_opts,seed_opts,changed)
         self.node_num = node_num
         self.avg_degree = avg_degree
         self.network_type = network_type # "SF" or "ER"
         self.player_type = player_type # "A" or "B" "C"
         self.update_rule = update_rule # "SP" or "SP"
+        self.engine = engine # "nx", "csr", "numba", "threads" or "sharded"
+        if engine == "numba":
+            self.backend = kernels
+        elif engine == "threads":
+            # edge-balanced thread pool
+            self.backend = threaded.ThreadedEngine(engine_opts['threads'])
+        elif engine == "sharded":
+            # one population over worker processes
+            self.backend = sharded.ShardedEngine(engine_opts['shards'])
+        else:
+            self.backend = csr_engine
+        if engine == "numba" and not kernels.HAVE_NUMBA:
+            print("numba not installed, falling back to NumPy kernels")
+        self.ns_mode = engine_opts['ns_mode']
+        self.incremental = engine_opts['incremental']
+        self.dirty_threshold = engine_opts['dirty_threshold']
+        self.tracker = None
+        self.replicas = engine_opts['replicas']
+        self.compact = engine_opts['compact']
+        self.save_format = io_opts['save_format']
+        self.save_dtype = io_opts['save_dtype']
+        self.writer = checkpoint.CheckpointWriter(io_opts['max_pending']) if io_opts['async_save'] else None
+        self.log_stats = io_opts['log_stats']
+        self.quantile_interval = io_opts['quantile_interval']
+        self.generator = graph_opts['generator']
+        graph_cache = graph_opts['graph_cache']
+        if isinstance(graph_cache,str):
+            graph_cache = GraphCache(graph_cache)
+        self.graph_cache = graph_cache
+        # independent graph, strategy and dynamics streams spawned from SeedSequence(seed, spawn_key),
+        # no seed leaves the global random state alone
+        rng = seed_opts['rng']
+        graph_seed = graph_opts['graph_seed']
+        self.seeds = None
+        if seed_opts['seed'] is not None:
+            self.seeds = seeding.SeedStreams(seed_opts['seed'],seed_opts['spawn_key'])
+            seeding.seed_global(self.seeds.dynamics)
+            graph_seed = self.seeds.graph
+        self.graph_seed = graph_seed
+        self.topology = graph_opts['topology']
+        # stopping criteria, keyword arguments of convergence.ConvergenceMonitor
+        # e.g. {'fixation': True,'adoption_window': 500,'drift_window': 1000,'drift_eps': 1e-3}
+        self.early_stop = early_stop
+        self.stop_reason = None
+        self.last_epoch = None
+        self.changes = 0 # players whose p or q changed in the last update
+        # philox draws are keyed by the dynamics seed, or fresh entropy without a seed,
+        # the same results for any number of threads or shards
+        self.rng = rng
+        self.counter_rng = None
+        if rng == "philox":
+            self.counter_rng = counter_rng.CounterRNG(self.seeds.dynamics if self.seeds is not None else None)
 
         if not os.path.exists("./result"):
             os.mkdir('./result')
@@ -27,6 +193,12 @@ class UG_Complex_Network():
             os.mkdir("./result/{}".format(self.dir_str))
         else:
             self.dir_str = check_point
+
+        # per-phase timers and counters of train, True also writes result/<run>/trace.json,
+        # a dict holds keyword arguments of profiler.Profiler
+        if profile is True:
+            profile = {'trace_path': os.path.join('./result/',self.dir_str,"trace.json")}
+        self.profiler = profiler.Profiler(**profile) if profile else profiler.disabled
     
     def build_network(self,network_type = None):
         '''
@@ -36,35 +208,104 @@ class UG_Complex_Network():
 
         if network_type == None:
             network_type = self.network_type
-        
-        if network_type == "SF":
+
+        if self.topology is not None:
+            G = csr_engine.CSRNetwork(replicas = self.replicas,compact = self.compact,**self.topology)
+        elif self.graph_cache is not None:
+            params = {'network_type': network_type,'node_num': self.node_num,'avg_degree': self.avg_degree,
+                      'generator': self.generator,'seed': self.graph_seed,'compact': self.compact}
+            topology = self.graph_cache.get_or_build(params,lambda: self.generate_topology(network_type))
+            G = csr_engine.CSRNetwork(replicas = self.replicas,compact = self.compact,**topology)
+        elif self.graph_seed is not None:
+            G = seeding.seeded_call(lambda: self.generate_network(network_type),self.graph_seed)
+        else:
+            G = self.generate_network(network_type)
+
+        if self.engine == "nx" and isinstance(G,csr_engine.CSRNetwork):
+            G = G.to_networkx()
+        elif self.engine != "nx" and not isinstance(G,csr_engine.CSRNetwork):
+            G = csr_engine.CSRNetwork.from_networkx(G,self.replicas,self.compact)
+
+        print("平均连接度为: ",self.avg_degree_caculate(G))
+        if self.engine != "nx":
+            report = G.memory_report()
+            print("memory: {:.1f} MB, {:.1f} bytes per node, {:.1f} bytes per edge".format(
+                report['total']/2**20,report['bytes_per_node'],report['bytes_per_edge']))
+        return G
+
+    def generate_network(self,network_type):
+        '''
+        new random network, networkx graph or CSRNetwork (array generator)
+        '''
+        if self.generator == "array" and network_type in ("SF","ER"):
+            if network_type == "SF":
+                m = int(self.avg_degree/2)
+                # at least m+1 initial nodes, so every step finds m distinct targets
+                indptr,indices = SFNet.barabasi_albert_csr(self.node_num,m_0 = max(SFNet.m_0,m+1),seq = [0]*(m-1) + [1])
+            else:
+                indptr,indices = ERNet.erdos_renyi_csr(self.node_num,self.avg_degree/self.node_num)
+            G = csr_engine.CSRNetwork(indptr,indices,replicas = self.replicas,compact = self.compact)
+        elif network_type == "SF":
             G = nx.random_graphs.barabasi_albert_graph(self.node_num, int(self.avg_degree/2))
         elif network_type == "ER":
             G = nx.random_graphs.erdos_renyi_graph(self.node_num, self.avg_degree/self.node_num)
             for n in G.nodes():
                 if G.degree(n) == 0:
                     while True:
-                        nbr = np.random.choice(G.nodes(),size = 1)[0]
+                        # same draw as np.random.choice(G.nodes()) without building the node list
+                        nbr = np.random.choice(self.node_num,size = 1)[0]
                         if nbr != n:
                             break
                     G.add_edge(n, nbr)
         elif "other":
             pass      
-
-        print("平均连接度为: ",self.avg_degree_caculate(G))
         return G
 
+    def generate_topology(self,network_type):
+        '''
+        CSR arrays (indptr, indices, degree, src) of a new random network, in the compact layout when set
+        '''
+        G = self.generate_network(network_type)
+        if not isinstance(G,csr_engine.CSRNetwork):
+            G = csr_engine.CSRNetwork.from_networkx(G,compact = self.compact)
+        return {'indptr': G.indptr,'indices': G.indices,'degree': G.degree,'src': G.src}
+
     def initialize_strategy(self,G):
         '''
-        initialize every node's strategy
+        initialize every node's strategy, from the strategy stream when seeded
         '''
-        self.strategy_asigned(G,list(G.nodes()),Type = self.player_type)
+        if self.seeds is None:
+            self.strategy_asigned(G,list(G.nodes()),Type = self.player_type)
+            return
+        dynamics = self.counter_rng
+        if dynamics is not None:
+            self.counter_rng = counter_rng.CounterRNG(self.seeds.strategy)
+        try:
+            seeding.seeded_call(lambda: self.strategy_asigned(G,list(G.nodes()),Type = self.player_type),self.seeds.strategy)
+        finally:
+            self.counter_rng = dynamics
         
 
     def strategy_asigned(self,G,node_list,Type = 'B'):
         '''
         A B C ,three types inBdividual
         '''
+        if self.engine != "nx":
+            csr_engine.strategy_asigned(G,node_list,Type = Type,rng = self.counter_rng)
+            if self.engine == "sharded":
+                self.backend.push(G)
+            return
+
+        if self.counter_rng is not None:
+            node_list = list(node_list)
+            strategy = self.counter_rng.at(counter_rng.STRATEGY,node_list)
+            strategy_q = self.counter_rng.at(counter_rng.STRATEGY_Q,node_list) if Type == 'C' else strategy
+            for i,n in enumerate(node_list):
+                G.nodes[n]['p'] = strategy[i]
+                G.nodes[n]['q'] = 1-strategy[i] if Type == 'B' else strategy_q[i]
+                G.nodes[n]['payoff'] = 0
+            return
+
         if Type == 'B':
             for n in node_list:
                 #Type-A player
@@ -91,6 +332,13 @@ class UG_Complex_Network():
         using synchronous method to play ultimatum game 
         and update graph every generation
         '''
+        if self.engine != "nx":
+            if self.incremental:
+                self.incremental_play(G).play()
+            else:
+                self.backend.synchronous_play(G)
+            return
+
         for n, nbrs in G.adjacency():
             for nbr, _ in nbrs.items():
                 # proposer = n ,responder = nbr
@@ -115,25 +363,51 @@ class UG_Complex_Network():
         each player i in the network selects at random one neighbor j 
         and compares its payoff Πi with that of j
         '''
+        if self.engine != "nx":
+            if self.ns_mode == "seq":
+                cnt,changed = self.backend.natural_selection_sequential(G,self.counter_rng)
+            else:
+                cnt,changed = self.backend.natural_selection(G,self.counter_rng)
+            if self.incremental:
+                self.incremental_play(G).mark_dirty(changed)
+            self.changes = len(changed)
+            return cnt
+
         cnt = 0
+        self.changes = 0
+        rng = self.counter_rng
+        if rng is not None:
+            u_nbr = rng.random(counter_rng.NBR,(G.number_of_nodes(),))
+            u_adopt = rng.random(counter_rng.ADOPT,(G.number_of_nodes(),))
         for n in list(G.nodes()):
             nbrs = list(G.adj[n])
-            nbr = np.random.choice(nbrs,size = 1)[0]
+            if rng is None:
+                nbr = np.random.choice(nbrs,size = 1)[0]
+            else:
+                nbr = nbrs[min(int(u_nbr[n]*len(nbrs)),len(nbrs)-1)]
             n_payoff = G.nodes[n]['payoff']
             nbr_payoff = G.nodes[nbr]['payoff']
             if nbr_payoff > n_payoff:
                 probs_adopt =  (nbr_payoff - n_payoff)/(2*max(G.degree(n),G.degree(nbr)))
-                if np.random.rand() < probs_adopt:
+                if (np.random.rand() if rng is None else u_adopt[n]) < probs_adopt:
                     # n adopts nbr's strategy
                     cnt += 1
+                    if G.nodes[n]['p'] != G.nodes[nbr]['p'] or G.nodes[n]['q'] != G.nodes[nbr]['q']:
+                        self.changes += 1
                     G.nodes[n]['p'] = G.nodes[nbr]['p']
                     G.nodes[n]['q'] = G.nodes[nbr]['q']
         # print("occur:",cnt)
+        return cnt
 
     def social_penalty(self,G):
         '''
         remove the player with lowest payoff and replace it with random one
         '''
+        if self.engine != "nx":
+            if self.incremental:
+                return self.incremental_play(G).social_penalty(Type = self.player_type,rng = self.counter_rng)
+            return self.backend.social_penalty(G,Type = self.player_type,rng = self.counter_rng)
+
         lowest_n = 0
         for n in G.nodes():
             if G.nodes[n]['payoff'] < G.nodes[lowest_n]['payoff']:
@@ -143,6 +417,7 @@ class UG_Complex_Network():
         lowest_cluster.append(lowest_n)
         
         self.strategy_asigned(G,lowest_cluster,Type = self.player_type)
+        return lowest_cluster
         # for n in lowest_cluster:
         #     #Type-A player
         #     strategy = np.random.rand()
@@ -151,14 +426,108 @@ class UG_Complex_Network():
         #     G.nodes[n]['payoff'] = 0 
 
 
+    def incremental_play(self,G):
+        '''
+        payoff tracker of the incremental mode, one per graph
+        '''
+        if self.tracker is None or self.tracker.net is not G:
+            self.tracker = incremental.IncrementalPlay(G,self.dirty_threshold)
+        return self.tracker
+
+    def dirty_fractions(self):
+        '''
+        fraction of nodes whose payoff was recomputed (stale gain or still moving), every epoch of the incremental mode
+        '''
+        if self.tracker is None:
+            return []
+        return self.tracker.dirty_fractions
+
     def update(self,G):
         '''
-        natural seletion an social penalty
+        natural seletion an social penalty,
+        returns the number of adoptions (NS) or re-seeded players (SP)
         '''
         if self.update_rule == "NS":
-            self.natural_selection(G)
+            return self.natural_selection(G)
         elif self.update_rule == "SP":
-            self.social_penalty(G)
+            self.changes = len(self.social_penalty(G))
+            return self.changes
+
+    def train(self,G,Start,Epochs,save_interval = 100):
+        '''
+        play and update from epoch Start to Epochs,
+        save a check point every save_interval epochs
+        and log p/q statistics every epoch when log_stats is set.
+        with early_stop the run ends, after a final check point, once a criterion is met
+        '''
+        prof = self.profiler
+        written = self.writer.bytes_written if self.writer is not None else 0
+        log = None
+        if self.log_stats:
+            log = stats_log.StatsLog(os.path.join('./result/',self.dir_str),Start)
+        monitor = None
+        if self.early_stop is not None:
+            monitor = convergence.ConvergenceMonitor(**self.early_stop)
+        self.stop_reason = None
+        for Epoch in range(Start,Epochs+1):
+            if self.counter_rng is not None:
+                self.counter_rng.epoch = Epoch
+            prof.begin_epoch(Epoch)
+            with prof.phase('play'):
+                self.synchronous_play(G)
+            with prof.phase('update'):
+                adoptions = self.update(G)
+            if prof.enabled:
+                prof.count('edges',self.played_edges(G))
+                if self.update_rule == "NS":
+                    prof.count('adoptions',adoptions)
+                else:
+                    prof.count('sp_players',adoptions)
+                    prof.high('sp_cluster',adoptions)
+            self.last_epoch = Epoch
+            if log is not None or monitor is not None:
+                with prof.phase('stats'):
+                    # histograms only for the log and the drift criterion, quantiles only for the log
+                    record = None
+                    if log is not None or monitor.needs_record:
+                        p,q,_ = self.get_state(G)
+                        quantiles = log is not None and self.quantile_interval is not None and Epoch % self.quantile_interval == 0
+                        record = stats_log.epoch_record(Epoch,p,q,adoptions,self.changes,quantiles)
+                    if log is not None:
+                        log.append_record(record)
+                    if monitor is not None:
+                        self.stop_reason = monitor.update(self.changes,lambda: self.get_state(G)[:2],record)
+            if Epoch % save_interval == 0 or self.stop_reason is not None:
+                print("Epoch[{}]".format(Epoch))
+                if self.stop_reason is not None:
+                    print("stopped: ",self.stop_reason)
+                with prof.phase('save'):
+                    if log is not None:
+                        log.flush()
+                    nbytes = self.save(G,Epoch)
+                prof.count('bytes_written',nbytes or 0)
+                # self.viz(G)
+            prof.end_epoch(Epoch)
+            if self.stop_reason is not None:
+                break
+        if log is not None:
+            log.close()
+        self.flush()
+        if self.writer is not None:
+            # the background writer counts what it wrote
+            prof.count('bytes_written',self.writer.bytes_written - written)
+        prof.close()
+        return G
+
+    def played_edges(self,G):
+        '''
+        directed edges evaluated by the last synchronous_play, over all replicas
+        '''
+        if self.engine == "nx":
+            return 2*G.number_of_edges()
+        if self.incremental:
+            return self.incremental_play(G).edges_evaluated
+        return len(G.indices)*(self.replicas or 1)
 
     def viz(self,G,x_data = None,y_data = None):
         '''
@@ -186,60 +555,164 @@ class UG_Complex_Network():
         #Save Graph
         result_dir = './result/'
         info = "{}_{}_{}_{}".format(self.network_type,self.player_type,self.update_rule,Epoch)
-        Epoch_dir = os.path.join(result_dir,self.dir_str,info)
+        run_dir = os.path.join(result_dir,self.dir_str)
+        Epoch_dir = os.path.join(run_dir,info)
         if not os.path.exists(Epoch_dir):
             os.mkdir(Epoch_dir)
-        graph_path = os.path.join(Epoch_dir,info+"_Graph.yaml")
-        nx.write_yaml(G,graph_path)
-        #Save strategy
-        p_vector = self.get_all_values(G,'p')
-        q_vector = self.get_all_values(G,'q')
-        pq_array = np.vstack((p_vector,q_vector))
-        pq_path = os.path.join(Epoch_dir,info+"_strategy.csv")
-        pq = pd.DataFrame(data = pq_array)
-        pq.to_csv(pq_path)
+        #Save topology once, strategy and payoff every check point
+        if not checkpoint.has_topology(run_dir):
+            net = G if self.engine != "nx" else csr_engine.CSRNetwork.from_networkx(G)
+            checkpoint.save_topology(run_dir,net.indptr,net.indices)
+        p,q,payoff = self.get_state(G)
+        if self.writer is not None:
+            p,q,payoff = p.copy(),q.copy(),payoff.copy()
+        state_path = os.path.join(info,info+"_state.npy")
+        #manifest is written after the state, it points at the newest complete check point
+        return self.submit(checkpoint.save_snapshot,run_dir,state_path,p,q,payoff,self.save_dtype,
+                           self.manifest(Epoch,state_path))
+
+    def submit(self,fn,*args):
+        '''
+        run a check point job now, or hand it to the background writer
+        '''
+        if self.writer is None:
+            return fn(*args)
+        self.writer.submit(fn,*args)
+
+    def flush(self):
+        '''
+        block until all check points are written
+        '''
+        if self.writer is not None:
+            self.writer.flush()
 
+    def manifest(self,Epoch,state_path):
+        '''
+        what retrain needs to continue exactly where the run stopped
+        '''
+        return {
+            'network_type': self.network_type,
+            'player_type': self.player_type,
+            'update_rule': self.update_rule,
+            'node_num': self.node_num,
+            'avg_degree': self.avg_degree,
+            'replicas': self.replicas,
+            'epoch': Epoch,
+            'state': state_path,
+            'save_dtype': str(self.save_dtype),
+            'rng': checkpoint.get_rng_state(),
+            'counter_rng_seed': self.counter_rng.seed if self.counter_rng is not None else None,
+            'seeds': self.seeds.manifest() if self.seeds is not None else None,
+            'stop_reason': self.stop_reason,
+        }
 
     def retrain(self,filepath):
         '''
-        continue evolution from specific check point
+        continue evolution from specific check point,
+        a run that crashed before its first check point starts afresh
         '''
         print(filepath)
         filepath = os.path.join('./result/',filepath)
-        lists = os.listdir(filepath)   
+        manifest = checkpoint.read_manifest(filepath)
+        if manifest is not None:
+            # binary check point and random state, continues bit-identically (float64 snapshots)
+            self.network_type = manifest['network_type']
+            self.player_type = manifest['player_type']
+            self.update_rule = manifest['update_rule']
+            indptr,indices = checkpoint.load_topology(filepath)
+            p,q,payoff = checkpoint.load_state(os.path.join(filepath,manifest['state']))
+            G = csr_engine.CSRNetwork(indptr,indices,np.array(p),np.array(q),np.array(payoff),
+                                      replicas = manifest['replicas'],compact = self.compact)
+            if self.engine == "nx":
+                G = G.to_networkx()
+            checkpoint.set_rng_state(manifest['rng'])
+            if manifest.get('seeds') is not None:
+                self.seeds = seeding.SeedStreams(manifest['seeds']['entropy'],manifest['seeds']['spawn_key'])
+            if manifest.get('counter_rng_seed') is not None:
+                self.rng = "philox"
+                self.counter_rng = counter_rng.CounterRNG(manifest['counter_rng_seed'])
+            return G,manifest['epoch']+1
+        # check point directories are named network_player_rule_Epoch
+        lists = [fn for fn in os.listdir(filepath) if fn.split("_")[-1].isdigit()]
         lists.sort(key=lambda fn: os.path.getmtime(filepath + "/" + fn)) 
+        complete = [fn for fn in lists if os.path.exists(os.path.join(filepath,fn,fn+"_state.npy"))]
+        if not complete:
+            print("no complete check point, starting from Epoch 1")
+            G = self.build_network()
+            self.initialize_strategy(G)
+            return G,1
+        lists = complete
         result_dir = os.path.join(filepath, lists[-1])      
-        result_list = os.listdir(result_dir)
-        result_list.sort()
-        parse_str = result_list[0][:-5].split("_")
+        parse_str = lists[-1].split("_")
         self.network_type = parse_str[0]
         self.player_type = parse_str[1]
         self.update_rule = parse_str[2]
         Epoch = int(parse_str[3])
-        graph_path = os.path.join(result_dir,result_list[0])
-        G = nx.read_yaml(graph_path)
+        state_path = os.path.join(result_dir,lists[-1]+"_state.npy")
+        indptr,indices = checkpoint.load_topology(filepath)
+        p,q,payoff = checkpoint.load_state(state_path)
+        replicas = None if p.ndim == 1 else p.shape[0]
+        G = csr_engine.CSRNetwork(indptr,indices,np.array(p),np.array(q),np.array(payoff),
+                                  replicas = replicas,compact = self.compact)
+        if self.engine == "nx":
+            G = G.to_networkx()
         return G,Epoch+1
         
 
+    def to_networkx(self,G):
+        '''
+        networkx view of the current state, converted only when asked
+        '''
+        if self.engine != "nx":
+            self.pull(G)
+            return G.to_networkx()
+        return G
+
+    def pull(self,G):
+        '''
+        the sharded engine keeps the state in its workers, gather it into G before reading
+        '''
+        if self.engine == "sharded":
+            self.backend.pull(G)
+
+    def get_state(self,G):
+        '''
+        p, q and payoff arrays of all nodes
+        '''
+        if self.engine != "nx":
+            self.pull(G)
+            return G.p,G.q,G.payoff
+        return tuple(np.array(self.get_all_values(G,attr_name),dtype = np.float64) for attr_name in ('p','q','payoff'))
+
     def get_all_values(self,G,attr_name):
         '''
-        get specific attribute values of all nodes
+        get specific attribute values of all nodes (of all replicas)
         '''
+        if self.engine != "nx":
+            self.pull(G)
+            return getattr(G,attr_name).ravel().tolist()
         value_dict = nx.get_node_attributes(G,attr_name)
         value_list = list(value_dict.values())
         return value_list
 
     def pq_distribution(self,G,attr_name):
 
-        x_axis = np.arange(0,1.05,1/20) # 21 descrete points,range 0~1,step size 0.05
-        y_axis = np.zeros(x_axis.size)
         value_list = self.get_all_values(G,attr_name)
-        for v in value_list:
-            for i in range(x_axis.size):
-                if abs(v-x_axis[i]) < 0.05:
-                    y_axis[i] += 1
-        
-        return (x_axis,y_axis)
+        return (pq_stats.x_axis,pq_stats.window_histogram(value_list))
+
+    def pq_statistics(self,G,attr_name,stats = None):
+        '''
+        add the current p or q values (of all replicas) to running statistics
+        per log2 degree class, pass the returned stats back in to accumulate epochs
+        '''
+        if stats is None:
+            stats = pq_stats.RunningStats()
+        if self.engine != "nx":
+            self.pull(G)
+            return stats.update(getattr(G,attr_name),G.degree)
+        degree = np.array([G.degree(n) for n in G.nodes()])
+        values = np.array([G.nodes[n][attr_name] for n in G.nodes()])
+        return stats.update(values,degree)
 
 
         
@@ -247,6 +720,8 @@ class UG_Complex_Network():
         '''
         caculate average degree of graph
         '''
+        if self.engine != "nx":
+            return G.degree.sum()/self.node_num
         degree_total = 0
         for x in range(len(G.degree())):
             degree_total = degree_total + G.degree(x)
@@ -261,25 +736,20 @@ if __name__ == '__main__':
     player_type = "B"
     avg_degree = 4
     Epochs = 21000
+    engine = "csr" #"nx, csr, numba, threads or sharded"
     check_point = None
     # check_point = '2020-03-01-19-59-07'
     if check_point != None:
-        UG = UG_Complex_Network(node_num,network_type,update_rule,player_type,avg_degree,check_point)
+        UG = UG_Complex_Network(node_num,network_type,update_rule,player_type,avg_degree,check_point,engine)
         G,Start  = UG.retrain(check_point)
     else:
         Start = 1
-        UG = UG_Complex_Network(node_num,network_type,update_rule,player_type,avg_degree)
+        UG = UG_Complex_Network(node_num,network_type,update_rule,player_type,avg_degree,engine = engine)
         #bulids network structure
         G = UG.build_network()
         #initialize the strategy of player in network
         UG.initialize_strategy(G)
     #play game
-    for Epoch in range(Start,Epochs+1):
-        UG.synchronous_play(G)
-        UG.update(G)
-        if Epoch % 100 == 0:
-            print("Epoch[{}]".format(Epoch))
-            UG.save(G,Epoch)
-            # UG.viz(G)
+    UG.train(G,Start,Epochs)
             
         
@@ -0,0 +1,208 @@
+"""
+Throughput benchmarks of Ultimatum Game in complex network
+"""
+
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+
+import kernels
+from UG_Complex_Network import UG_Complex_Network
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+phases = ('build_network','initialize_strategy','synchronous_play','natural_selection','social_penalty','save')
+
+
+def peak_rss():
+    '''
+    peak resident memory of this process in bytes, None where resource is missing
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak*1024
+
+
+def available_engines():
+    return ["nx","csr","numba","threads","sharded"] if kernels.HAVE_NUMBA else ["nx","csr","threads","sharded"]
+
+
+def timed(fn,min_time = 1.0,max_reps = 100):
+    '''
+    call fn(rep) until min_time seconds or max_reps calls have passed,
+    (seconds per call, calls)
+    '''
+    reps = 0
+    start = time.perf_counter()
+    while True:
+        fn(reps)
+        reps += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or reps >= max_reps:
+            return elapsed/reps,reps
+
+
+def bench_case(case):
+    '''
+    time every phase of one (network_type, node_num, engine, generator) case,
+    meant to run in a fresh process so peak memory belongs to this case alone
+    (the workers of the sharded engine are not counted)
+    '''
+    network_type,node_num,engine,generator,avg_degree,min_time,seed,shards = case
+    np.random.seed(seed)
+    random.seed(seed)
+    check_point = os.path.join("bench","{}_{}_{}_{}".format(network_type,node_num,engine,generator))
+    run_dir = os.path.join("./result",check_point)
+    os.makedirs(run_dir,exist_ok = True)
+    result = {'network_type': network_type,'node_num': node_num,'engine': engine,
+              'generator': generator,'avg_degree': avg_degree,'phases': {}}
+    UG = None
+    try:
+        engine_options = None
+        if engine == "sharded":
+            result['shards'] = shards
+            engine_options = {'shards': shards}
+        UG = UG_Complex_Network(node_num,network_type,"NS","B",avg_degree,check_point,engine,
+                                engine_options = engine_options,graph_options = {'generator': generator})
+        start = time.perf_counter()
+        G = UG.build_network()
+        result['phases']['build_network'] = {'seconds': time.perf_counter() - start,'calls': 1,'peak_rss': peak_rss()}
+        edges = len(G.indices) if engine != "nx" else 2*G.number_of_edges()
+        result['edges'] = edges
+        steps = {
+            'initialize_strategy': lambda rep: UG.initialize_strategy(G),
+            'synchronous_play': lambda rep: UG.synchronous_play(G),
+            'natural_selection': lambda rep: UG.natural_selection(G),
+            'social_penalty': lambda rep: UG.social_penalty(G),
+            'save': lambda rep: UG.save(G,rep+2),
+        }
+        for phase,fn in steps.items():
+            # the first call compiles the numba kernels and writes the topology
+            fn(-1)
+            seconds,calls = timed(fn,min_time)
+            result['phases'][phase] = {'seconds': seconds,'calls': calls,'peak_rss': peak_rss()}
+        play = result['phases']['synchronous_play']
+        play['edges_per_second'] = edges/play['seconds']
+        for phase in ('synchronous_play','natural_selection','social_penalty'):
+            result['phases'][phase]['gens_per_second'] = 1/result['phases'][phase]['seconds']
+        result['build_edges_per_second'] = edges/result['phases']['build_network']['seconds']
+    except MemoryError:
+        result['error'] = "MemoryError"
+    finally:
+        if UG is not None and engine == "sharded":
+            UG.backend.close()
+        shutil.rmtree(run_dir,ignore_errors = True)
+    result['peak_rss'] = peak_rss()
+    return result
+
+
+def environment():
+    return {
+        'time': time.strftime("%Y-%m-%d-%H-%M-%S",time.localtime()),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'networkx': nx.__version__,
+        'numba': kernels.numba.__version__ if kernels.HAVE_NUMBA else None,
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_suite(network_types = ("ER","SF"),sizes = (10**3,10**4,10**5,10**6,10**7),engines = None,
+              avg_degree = 4,min_time = 1.0,max_nodes = None,seed = 0,out = None,shards = None):
+    '''
+    every network_type x size x engine case in its own process, the networkx
+    path with the networkx generator and the array engines with the array generator.
+    cases above max_nodes[engine] are skipped (networkx needs about 1 kB per node and
+    erdos_renyi_graph is quadratic, ER at 10^5 nodes takes about ten minutes to build).
+    results are rewritten to out (JSON) after every case, so an interrupted suite keeps its numbers.
+    the sharded engine runs on shards worker processes, every core by default
+    '''
+    if engines is None:
+        engines = available_engines()
+    if max_nodes is None:
+        max_nodes = {'nx': 10**5}
+    if shards is None:
+        shards = os.cpu_count()
+    if out is None:
+        out = "./result/bench/bench_{}.json".format(time.strftime("%Y-%m-%d-%H-%M-%S",time.localtime()))
+    os.makedirs(os.path.dirname(out),exist_ok = True)
+    report = {'environment': environment(),'min_time': min_time,'seed': seed,'shards': shards,'cases': []}
+    context = multiprocessing.get_context("spawn")
+    for network_type in network_types:
+        for node_num in sizes:
+            for engine in engines:
+                if node_num > max_nodes.get(engine,float('inf')):
+                    continue
+                generator = "nx" if engine == "nx" else "array"
+                case = (network_type,node_num,engine,generator,avg_degree,min_time,seed,shards)
+                print("bench: ",case[:4])
+                with concurrent.futures.ProcessPoolExecutor(1,mp_context = context) as pool:
+                    try:
+                        result = pool.submit(bench_case,case).result()
+                    except concurrent.futures.process.BrokenProcessPool:
+                        # killed, most likely out of memory
+                        result = {'network_type': network_type,'node_num': node_num,'engine': engine,
+                                  'generator': generator,'avg_degree': avg_degree,'error': "worker died"}
+                report['cases'].append(result)
+                with open(out,'w') as f:
+                    json.dump(report,f,indent = 1)
+    summary(report)
+    return out
+
+
+def summary(report):
+    for case in report['cases']:
+        name = "{} n={} {}".format(case['network_type'],case['node_num'],case['engine'])
+        if 'error' in case:
+            print(name,case['error'])
+            continue
+        phases = case['phases']
+        print("{}: build {:.2f} s, play {:.3g} edges/s, NS {:.3g} gens/s, SP {:.3g} gens/s, peak {:.0f} MB".format(
+            name,phases['build_network']['seconds'],phases['synchronous_play']['edges_per_second'],
+            phases['natural_selection']['gens_per_second'],phases['social_penalty']['gens_per_second'],
+            (case['peak_rss'] or 0)/2**20))
+
+
+def compare(old_path,new_path):
+    '''
+    seconds per call of every phase, new relative to old (< 1 is faster), for cases in both files
+    '''
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    key = lambda case: (case['network_type'],case['node_num'],case['engine'],case['generator'])
+    old_cases = {key(case): case for case in old['cases'] if 'error' not in case}
+    ratios = {}
+    for case in new['cases']:
+        if 'error' in case or key(case) not in old_cases:
+            continue
+        ratios[key(case)] = {phase: case['phases'][phase]['seconds']/old_cases[key(case)]['phases'][phase]['seconds']
+                             for phase in phases}
+        print(key(case)," ".join("{} {:.2f}".format(phase,r) for phase,r in ratios[key(case)].items()))
+    return ratios
+
+
+if __name__ == '__main__':
+
+    network_types = ("ER","SF")
+    sizes = (10**3,10**4,10**5,10**6,10**7)
+    engines = None # every available engine
+    max_nodes = {'nx': 10**5} # the networkx path is skipped above this size
+    shards = None # worker processes of the sharded engine, every core by default
+    run_suite(network_types,sizes,engines,max_nodes = max_nodes,shards = shards)
@@ -0,0 +1,154 @@
+"""
+Binary check points of Ultimatum Game in complex network
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+
+def has_topology(run_dir):
+    return os.path.exists(os.path.join(run_dir,"topology","indices.npy"))
+
+
+def save_topology(run_dir,indptr,indices):
+    '''
+    CSR adjacency, written once per run
+    '''
+    topology_dir = os.path.join(run_dir,"topology")
+    if has_topology(run_dir):
+        return topology_dir
+    os.makedirs(topology_dir,exist_ok = True)
+    np.save(os.path.join(topology_dir,"indptr.npy"),indptr)
+    # indices last, its presence marks a complete topology
+    np.save(os.path.join(topology_dir,"indices.npy"),indices)
+    return topology_dir
+
+
+def load_topology(run_dir,mmap_mode = 'r'):
+    topology_dir = os.path.join(run_dir,"topology")
+    indptr = np.load(os.path.join(topology_dir,"indptr.npy"),mmap_mode = mmap_mode)
+    indices = np.load(os.path.join(topology_dir,"indices.npy"),mmap_mode = mmap_mode)
+    return indptr,indices
+
+
+def save_state(path,p,q,payoff,dtype = np.float64):
+    '''
+    p, q and payoff stacked into one (3, ...) array,
+    float64 keeps the run bit-exact, float32 halves the size
+    '''
+    state = np.empty((3,) + np.shape(p),dtype = dtype)
+    state[0] = p
+    state[1] = q
+    state[2] = payoff
+    np.save(path,state)
+    return state.nbytes
+
+
+def load_state(path,mmap_mode = 'r'):
+    '''
+    (p, q, payoff) views of a snapshot
+    '''
+    state = np.load(path,mmap_mode = mmap_mode)
+    return state[0],state[1],state[2]
+
+
+def save_snapshot(run_dir,state_path,p,q,payoff,dtype,manifest):
+    '''
+    state file first, then the manifest that points at it
+    '''
+    nbytes = save_state(os.path.join(run_dir,state_path),p,q,payoff,dtype = dtype)
+    write_manifest(run_dir,manifest)
+    return nbytes
+
+
+def get_rng_state():
+    '''
+    state of the global numpy random stream, as plain JSON types
+    '''
+    name,keys,pos,has_gauss,cached_gaussian = np.random.get_state()
+    return {'bit_generator': name,'keys': keys.tolist(),'pos': int(pos),
+            'has_gauss': int(has_gauss),'cached_gaussian': float(cached_gaussian)}
+
+
+def set_rng_state(state):
+    np.random.set_state((state['bit_generator'],np.array(state['keys'],dtype = np.uint32),state['pos'],
+                         state['has_gauss'],state['cached_gaussian']))
+
+
+def write_json(path,obj):
+    '''
+    replace a JSON file atomically, a crash leaves the previous one (or none) intact
+    '''
+    with open(path+".tmp",'w') as f:
+        json.dump(obj,f)
+    os.replace(path+".tmp",path)
+
+
+def write_manifest(run_dir,manifest):
+    write_json(os.path.join(run_dir,"manifest.json"),manifest)
+
+
+def read_manifest(run_dir):
+    path = os.path.join(run_dir,"manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class CheckpointWriter():
+    '''
+    writes check points on a background thread in submission order.
+    at most max_pending jobs wait in the queue, submit blocks beyond that (backpressure).
+    jobs must only hold copies of the simulation state
+    '''
+    def __init__(self,max_pending = 2):
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+        self.bytes_written = 0
+        self.thread = threading.Thread(target = self.run,daemon = True)
+        self.thread.start()
+        # daemon thread would be killed at exit, drain the queue first
+        atexit.register(self.close)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                fn,args = job
+                if self.error is None:
+                    nbytes = fn(*args)
+                    self.bytes_written += nbytes or 0
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def submit(self,fn,*args):
+        self.raise_error()
+        self.queue.put((fn,args))
+
+    def flush(self):
+        '''
+        wait until every submitted check point is on disk
+        '''
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            error,self.error = self.error,None
+            raise RuntimeError("check point writer failed") from error
@@ -0,0 +1,51 @@
+"""
+Convergence detection for early stopping of Ultimatum Game in complex network
+"""
+
+import collections
+
+import numpy as np
+
+
+class ConvergenceMonitor():
+    '''
+    checks every epoch for
+    fixation: within every replica all players hold the same p and q, so no adoption can change anything
+    (replicas may fix at different strategies),
+    no adoption changed any strategy during the last adoption_window epochs,
+    drift: the p and q histograms moved less than drift_eps (sum of both total variation distances)
+    over the last drift_window epochs, from the statistics records (stats_log.epoch_record).
+    a criterion is off when its window is None, only drift needs the records
+    '''
+    def __init__(self,fixation = True,adoption_window = None,drift_window = None,drift_eps = 1e-3):
+        self.fixation = fixation
+        self.adoption_window = adoption_window
+        self.drift_window = drift_window
+        self.drift_eps = drift_eps
+        self.quiet_epochs = 0
+        self.histograms = collections.deque(maxlen = (drift_window or 0) + 1)
+        self.needs_record = drift_window is not None
+
+    def update(self,changes,state,record = None):
+        '''
+        the reason to stop after this epoch, None to go on.
+        changes is the number of players whose strategy changed, state() -> (p, q) of shape (N,)
+        or (R, N) is only called when it is 0 (a fixed population cannot change)
+        '''
+        if self.fixation and changes == 0:
+            p,q = state()
+            # per replica, the last axis holds the players
+            if (p.min(axis = -1) == p.max(axis = -1)).all() and (q.min(axis = -1) == q.max(axis = -1)).all():
+                return "fixation"
+        if self.adoption_window is not None:
+            self.quiet_epochs = self.quiet_epochs + 1 if changes == 0 else 0
+            if self.quiet_epochs >= self.adoption_window:
+                return "no strategy change in {} epochs".format(self.adoption_window)
+        if self.drift_window is not None:
+            self.histograms.append(np.concatenate([record['p_hist']/record['p_hist'].sum(),
+                                                   record['q_hist']/record['q_hist'].sum()]))
+            if len(self.histograms) == self.histograms.maxlen:
+                drift = 0.5*np.abs(self.histograms[-1] - self.histograms[0]).sum()
+                if drift < self.drift_eps:
+                    return "histogram drift {:.2e} over {} epochs".format(drift,self.drift_window)
+        return None
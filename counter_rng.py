@@ -0,0 +1,101 @@
+"""
+Counter-based per-node random numbers for Ultimatum Game in complex network
+"""
+
+import numpy as np
+
+# what a draw is for, third word of the Philox counter
+NBR = 0 # neighbour choice of natural selection
+ADOPT = 1 # adoption draw of natural selection
+STRATEGY = 2 # p of a new strategy (and q = 1-p or p, types B and A)
+STRATEGY_Q = 3 # q of a new type C strategy
+
+mask32 = np.uint64(0xFFFFFFFF)
+multipliers = (np.uint64(0xD2E7470EE14C6C93),np.uint64(0xCA5A826395121157))
+weyl = (np.uint64(0x9E3779B97F4A7C15),np.uint64(0xBB67AE8584CAA73B))
+
+
+def mulhilo(a,b):
+    '''
+    high and low 64 bits of the 128-bit products a*b (uint64 arrays)
+    '''
+    a_lo,a_hi = a & mask32,a >> np.uint64(32)
+    b_lo,b_hi = b & mask32,b >> np.uint64(32)
+    lo_lo = a_lo*b_lo
+    hi_lo = a_hi*b_lo
+    lo_hi = a_lo*b_hi
+    mid = (lo_lo >> np.uint64(32)) + (hi_lo & mask32) + (lo_hi & mask32)
+    hi = a_hi*b_hi + (hi_lo >> np.uint64(32)) + (lo_hi >> np.uint64(32)) + (mid >> np.uint64(32))
+    return hi,a*b
+
+
+def philox4x64(counter,key,rounds = 10):
+    '''
+    Philox4x64-10 block of every counter, counter is a sequence of 4 uint64 arrays,
+    the same function as numpy's Philox bit generator
+    '''
+    c0,c1,c2,c3 = (np.asarray(c,dtype = np.uint64) for c in counter)
+    k0,k1 = np.uint64(key[0]),np.uint64(key[1])
+    with np.errstate(over = 'ignore'):
+        for r in range(rounds):
+            if r:
+                k0 = k0 + weyl[0]
+                k1 = k1 + weyl[1]
+            hi0,lo0 = mulhilo(multipliers[0],c0)
+            hi1,lo1 = mulhilo(multipliers[1],c2)
+            c0,c1,c2,c3 = hi1 ^ c1 ^ k0,lo1,hi0 ^ c3 ^ k1,lo0
+    return c0,c1,c2,c3
+
+
+class CounterRNG():
+    '''
+    uniform draws that are a pure function of (seed, epoch, purpose, replica, node):
+    node n of a (epoch, purpose, replica) stream is the n-th output of numpy's Philox
+    started at counter (0, epoch, purpose, replica) with a key derived from seed.
+    no state is consumed, so results do not depend on the order of the draws,
+    the number of threads or how nodes are split over shards.
+    epoch is set by the training loop before every generation.
+    seed None draws fresh entropy from the OS, seed then holds it so the stream can be rebuilt
+    '''
+    def __init__(self,seed = None):
+        root = np.random.SeedSequence(seed)
+        self.seed = root.entropy
+        self.key = root.generate_state(2,np.uint64)
+        self.epoch = 0
+
+    def range(self,purpose,lo,hi,replica = 0):
+        '''
+        draws of nodes lo..hi-1, numpy's Philox started at the block of node lo
+        '''
+        start = lo - lo % 4
+        counter = np.array([start//4,self.epoch,purpose,replica],dtype = np.uint64)
+        stream = np.random.Generator(np.random.Philox(counter = counter,key = self.key))
+        return stream.random(hi - start)[lo - start:]
+
+    def random(self,purpose,shape):
+        '''
+        draws of all nodes, shape (node_num,) or (replicas,node_num)
+        '''
+        if len(shape) == 1:
+            return self.range(purpose,0,shape[0])
+        return np.stack([self.range(purpose,0,shape[1],r) for r in range(shape[0])])
+
+    def at(self,purpose,nodes,replicas = 0):
+        '''
+        draws of the given nodes (of the given replicas), same values as random().
+        a dense set of nodes (one in 64 or more of its id range) is cut out of range(),
+        a sparse one goes through the vectorized Philox, about 60 times slower per draw
+        '''
+        nodes = np.asarray(nodes,dtype = np.int64)
+        if np.ndim(replicas) == 0 and nodes.size and 64*nodes.size >= nodes.max() - nodes.min():
+            lo = int(nodes.min())
+            return self.range(purpose,lo,int(nodes.max()) + 1,int(replicas))[nodes - lo]
+        nodes = nodes.astype(np.uint64)
+        replicas = np.broadcast_to(np.asarray(replicas,dtype = np.uint64),nodes.shape)
+        # Philox advances its counter before the first block, lane n%4 of block n//4 + 1
+        block = nodes//np.uint64(4) + np.uint64(1)
+        words = philox4x64((block,np.full(nodes.shape,self.epoch,dtype = np.uint64),
+                            np.full(nodes.shape,purpose,dtype = np.uint64),replicas),self.key)
+        lane = (nodes % np.uint64(4)).astype(np.int64)
+        bits = np.choose(lane,words)
+        return (bits >> np.uint64(11))*(1.0/9007199254740992.0)
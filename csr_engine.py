@@ -0,0 +1,336 @@
+"""
+Array-backed (CSR) engine for Ultimatum Game in complex network
+"""
+
+import networkx as nx
+import numpy as np
+
+import counter_rng
+
+
+def index_dtypes(node_num,edge_num,compact = False):
+    '''
+    dtypes of node ids (indices, src) and of edge offsets (indptr, degree)
+    '''
+    if not compact:
+        return np.int64,np.int64
+    return (np.int32 if node_num < 2**31 else np.int64),(np.int32 if edge_num < 2**31 else np.int64)
+
+
+class CSRNetwork():
+    '''
+    graph stored as CSR arrays (indptr/indices),
+    every node's p, q and payoff held as contiguous vectors,
+    or as replicas x node_num arrays for independent populations sharing the graph.
+    replica arrays are stored node-major (Fortran order) so that the values
+    of one node in all replicas are adjacent in memory.
+    compact stores p, q and payoff as float32 and node ids (indices, src) as int32
+    when there are fewer than 2**31 nodes, indptr and degree as int32 when there are
+    fewer than 2**31 directed edges, int64 otherwise
+    '''
+    def __init__(self,indptr,indices,p = None,q = None,payoff = None,replicas = None,degree = None,src = None,compact = False):
+        self.compact = compact
+        node_dtype,edge_dtype = index_dtypes(len(indptr) - 1,len(indices),compact)
+        state_dtype = np.float32 if compact else np.float64
+        self.indptr = np.ascontiguousarray(indptr,dtype = edge_dtype)
+        self.indices = np.ascontiguousarray(indices,dtype = node_dtype)
+        self.node_num = self.indptr.size - 1
+        # degree and src are derived from indptr once, or passed in (shared between networks)
+        self.degree = np.diff(self.indptr) if degree is None else np.ascontiguousarray(degree,dtype = edge_dtype)
+        self.replicas = replicas
+        shape = (self.node_num,) if replicas is None else (replicas,self.node_num)
+        self.p = np.zeros(shape,dtype = state_dtype,order = 'F') if p is None else np.asarray(p,dtype = state_dtype,order = 'F')
+        self.q = np.zeros(shape,dtype = state_dtype,order = 'F') if q is None else np.asarray(q,dtype = state_dtype,order = 'F')
+        self.payoff = np.zeros(shape,dtype = state_dtype,order = 'F') if payoff is None else np.asarray(payoff,dtype = state_dtype,order = 'F')
+        # source node of every directed edge, CSR order
+        if src is None:
+            self.src = np.repeat(np.arange(self.node_num,dtype = node_dtype),self.degree)
+        else:
+            self.src = np.ascontiguousarray(src,dtype = node_dtype)
+
+    @classmethod
+    def from_networkx(cls,G,replicas = None,compact = False):
+        '''
+        convert networkx graph once, node i is the i-th node of G.nodes()
+        and neighbours keep G.adjacency() order.
+        list-valued p/q/payoff attributes hold one value per replica
+        '''
+        nodes = list(G.nodes())
+        index = {n:i for i,n in enumerate(nodes)}
+        degree = np.fromiter((len(G.adj[n]) for n in nodes),dtype = np.int64,count = len(nodes))
+        indptr = np.zeros(len(nodes)+1,dtype = np.int64)
+        np.cumsum(degree,out = indptr[1:])
+        indices = np.fromiter((index[nbr] for n in nodes for nbr in G.adj[n]),dtype = np.int64,count = indptr[-1])
+        values = nx.get_node_attributes(G,'p')
+        if len(values) == len(nodes) and isinstance(values[nodes[0]],list):
+            replicas = len(values[nodes[0]])
+        net = cls(indptr,indices,replicas = replicas,compact = compact)
+        for attr_name in ('p','q','payoff'):
+            values = nx.get_node_attributes(G,attr_name)
+            if len(values) == len(nodes):
+                getattr(net,attr_name)[:] = np.array([values[n] for n in nodes]).T
+        return net
+
+    def to_networkx(self):
+        '''
+        build networkx graph with p, q and payoff as node attributes,
+        one list entry per replica in batched mode
+        '''
+        G = nx.Graph()
+        G.add_nodes_from(range(self.node_num))
+        # fill the adjacency dicts directly so every node keeps its CSR neighbour order,
+        # the order random neighbour picks and social penalty clusters depend on
+        edge_data = {}
+        indices = self.indices.tolist()
+        indptr = self.indptr.tolist()
+        for n in range(self.node_num):
+            nbrs = G._adj[n]
+            for nbr in indices[indptr[n]:indptr[n+1]]:
+                nbrs[nbr] = edge_data.setdefault((min(n,nbr),max(n,nbr)),{})
+        for attr_name in ('p','q','payoff'):
+            values = getattr(self,attr_name).T.tolist()
+            for n in range(self.node_num):
+                G.nodes[n][attr_name] = values[n]
+        return G
+
+    def copy(self):
+        '''
+        shares the graph arrays, owns a copy of p, q and payoff
+        '''
+        return CSRNetwork(self.indptr,self.indices,self.p.copy(order = 'K'),self.q.copy(order = 'K'),
+                          self.payoff.copy(order = 'K'),replicas = self.replicas,
+                          degree = self.degree,src = self.src,compact = self.compact)
+
+    def nodes(self):
+        return range(self.node_num)
+
+    def neighbors(self,n):
+        return self.indices[self.indptr[n]:self.indptr[n+1]]
+
+    def number_of_edges(self):
+        return self.indices.size//2
+
+    def memory_report(self):
+        '''
+        bytes held by the network: per node (p, q, payoff, indptr, degree)
+        and per undirected edge (indices and src of both directions)
+        '''
+        node_bytes = sum(getattr(self,name).nbytes for name in ('p','q','payoff','indptr','degree'))
+        edge_bytes = self.indices.nbytes + self.src.nbytes
+        return {'total': node_bytes + edge_bytes,
+                'bytes_per_node': node_bytes/max(self.node_num,1),
+                'bytes_per_edge': edge_bytes/max(self.number_of_edges(),1)}
+
+
+def edges_to_csr(src,dst,node_num):
+    '''
+    symmetric CSR adjacency of the undirected edges src[i]-dst[i],
+    every node lists the nodes it is src of (in edge order), then the nodes it is dst of
+    '''
+    src = np.asarray(src)
+    dst = np.asarray(dst)
+    out_degree = np.bincount(src,minlength = node_num)
+    in_degree = np.bincount(dst,minlength = node_num)
+    indptr = np.zeros(node_num+1,dtype = np.int64)
+    np.cumsum(out_degree + in_degree,out = indptr[1:])
+    indices = np.empty(indptr[-1],dtype = np.int32 if node_num < 2**31 else np.int64)
+    # generators emit edges grouped by src, the stable sort is then a single linear pass
+    order = np.argsort(src,kind = 'stable')
+    ends = src[order]
+    rank = np.arange(src.size) - (np.cumsum(out_degree) - out_degree)[ends]
+    indices[indptr[ends] + rank] = dst[order]
+    order = np.argsort(dst)
+    ends = dst[order]
+    rank = np.arange(dst.size) - (np.cumsum(in_degree) - in_degree)[ends]
+    indices[indptr[ends] + out_degree[ends] + rank] = src[order]
+    return indptr,indices
+
+
+def row_edges(indptr,rows):
+    '''
+    edge ids of the given CSR rows (in row order) and the sub-indptr over them
+    '''
+    starts = indptr[rows]
+    lengths = indptr[rows+1] - starts
+    sub_indptr = np.zeros(rows.size+1,dtype = np.int64)
+    np.cumsum(lengths,out = sub_indptr[1:])
+    edge_ids = np.arange(sub_indptr[-1],dtype = np.int64) + np.repeat(starts - sub_indptr[:-1],lengths)
+    return edge_ids,sub_indptr
+
+
+def segment_sum(values,indptr,row_ids = None):
+    '''
+    sum values over every CSR row (last axis), empty rows give 0.
+    a single population goes through np.bincount over the row of every value
+    (row_ids, e.g. net.src, repeated from indptr when not given), which adds
+    in value order within a row, replicas through np.add.reduceat
+    '''
+    degree = np.diff(indptr)
+    if values.ndim == 1:
+        if row_ids is None:
+            row_ids = np.repeat(np.arange(degree.size),degree)
+        return np.bincount(row_ids,values,minlength = degree.size).astype(values.dtype,copy = False)
+    sums = np.zeros(values.shape[:-1] + (degree.size,),dtype = values.dtype)
+    nonempty = degree > 0
+    if values.shape[-1]:
+        sums[...,nonempty] = np.add.reduceat(values,indptr[:-1][nonempty],axis = -1)
+    return sums
+
+
+def edge_gain(p,q,src,dst):
+    '''
+    payoff node src earns on directed edge (src,dst),
+    as proposer (1-p_src if p_src > q_dst) plus as responder (p_dst if p_dst > q_src).
+    np.take gathers faster than fancy indexing, the dst gathers are the random accesses
+    '''
+    p_src = np.take(p,src,axis = -1)
+    gain = 1-p_src
+    gain *= p_src > np.take(q,dst,axis = -1)
+    p_dst = np.take(p,dst,axis = -1)
+    p_dst *= p_dst > np.take(q,src,axis = -1)
+    gain += p_dst
+    return gain
+
+
+def synchronous_play(net):
+    '''
+    same rule as UG_Complex_Network.synchronous_play as a handful of array calls over the
+    directed edge list (src, indices): gather, both masks, sum into the source nodes
+    '''
+    gain = segment_sum(edge_gain(net.p,net.q,net.src,net.indices),net.indptr,net.src)
+    net.payoff += gain
+    nonzero = net.degree != 0
+    net.payoff[...,nonzero] /= net.degree[nonzero]
+
+
+def uniform(rng,purpose,shape):
+    '''
+    np.random.rand(*shape) from the global stream,
+    or the counter-based draws of all nodes when rng (counter_rng.CounterRNG) is given
+    '''
+    if rng is None:
+        return np.random.rand(*shape)
+    return rng.random(purpose,shape)
+
+
+def strategy_asigned(net,node_list,Type = 'B',replica_list = None,rng = None):
+    '''
+    A B C ,three types individual,
+    draws random numbers in the same order as the networkx path.
+    in batched mode node_list is assigned in every replica,
+    or only in replica_list[i] for node_list[i] when given.
+    with rng every node's strategy is drawn from its own counter
+    '''
+    node_list = np.asarray(node_list,dtype = np.int64)
+    if replica_list is None:
+        index = (Ellipsis,node_list)
+    else:
+        index = (np.asarray(replica_list,dtype = np.int64),node_list)
+    shape = net.p[index].shape
+    if rng is None:
+        # p and q of type C drawn alternately per node, as in the networkx path
+        strategy = np.random.rand(*shape,2) if Type == 'C' else np.random.rand(*shape)
+    else:
+        if replica_list is not None:
+            replicas = index[0]
+        elif net.replicas is not None:
+            replicas = np.arange(net.replicas)[:,None]
+        else:
+            replicas = 0
+        nodes = np.broadcast_to(node_list,shape)
+        strategy = rng.at(counter_rng.STRATEGY,nodes,replicas)
+        if Type == 'C':
+            strategy = np.stack([strategy,rng.at(counter_rng.STRATEGY_Q,nodes,replicas)],-1)
+    if Type == 'B':
+        net.p[index] = strategy
+        net.q[index] = 1-strategy
+    elif Type == 'A':
+        net.p[index] = strategy
+        net.q[index] = strategy
+    elif Type == 'C':
+        net.p[index] = strategy[...,0]
+        net.q[index] = strategy[...,1]
+    net.payoff[index] = 0
+
+
+def natural_selection(net,rng = None):
+    '''
+    each player i selects at random one neighbor j
+    and adopts j's strategy with probability (Πj-Πi)/(2*max(ki,kj)),
+    all players at once: one neighbour draw and one adoption draw per node,
+    adoptions copy the strategies of the previous generation (synchronous),
+    returns the adoption count and the nodes whose p or q actually changed
+    '''
+    shape = net.p.shape
+    degree = net.degree
+    has_nbr = degree > 0
+    offset = np.minimum((uniform(rng,counter_rng.NBR,shape)*degree).astype(np.int64),np.maximum(degree-1,0))
+    nbr = net.indices[np.minimum(net.indptr[:-1] + offset,net.indices.size-1)]
+    payoff_diff = np.take_along_axis(net.payoff,nbr,-1) - net.payoff
+    probs_adopt = payoff_diff/(2*np.maximum(np.maximum(degree,degree[nbr]),1))
+    adopt = has_nbr & (payoff_diff > 0) & (uniform(rng,counter_rng.ADOPT,shape) < probs_adopt)
+    return apply_adoptions(net,np.where(adopt,nbr,-1))
+
+
+def apply_adoptions(net,src):
+    '''
+    every node with src >= 0 copies p and q of node src, -1 keeps its strategy.
+    src has the shape of net.p, all copies read the previous generation (synchronous),
+    returns the adoption count and the nodes whose p or q actually changed
+    '''
+    # (node,) or (replica,node) index of the adopters and of the neighbours they copy
+    adopters = np.nonzero(src >= 0)
+    src = adopters[:-1] + (src[adopters],)
+    moved = (net.p[src] != net.p[adopters]) | (net.q[src] != net.q[adopters])
+    changed = adopters[-1][moved]
+    net.p[adopters] = net.p[src]
+    net.q[adopters] = net.q[src]
+    return int(moved.size),changed
+
+
+def natural_selection_sequential(net,rng = None):
+    '''
+    each player i selects at random one neighbor j
+    and adopts j's strategy with probability (Πj-Πi)/(2*max(ki,kj)),
+    node by node in the same order and with the same random draws as the networkx path
+    '''
+    cnt = 0
+    changed = []
+    p,q,payoff,degree = net.p,net.q,net.payoff,net.degree
+    if rng is not None:
+        u_nbr = rng.random(counter_rng.NBR,(net.node_num,))
+        u_adopt = rng.random(counter_rng.ADOPT,(net.node_num,))
+    for n in range(net.node_num):
+        if rng is None:
+            nbr = np.random.choice(net.neighbors(n),size = 1)[0]
+        else:
+            nbr = net.neighbors(n)[min(int(u_nbr[n]*degree[n]),degree[n]-1)]
+        if payoff[nbr] > payoff[n]:
+            probs_adopt = (payoff[nbr] - payoff[n])/(2*max(degree[n],degree[nbr]))
+            if (np.random.rand() if rng is None else u_adopt[n]) < probs_adopt:
+                cnt += 1
+                if p[n] != p[nbr] or q[n] != q[nbr]:
+                    changed.append(n)
+                p[n] = p[nbr]
+                q[n] = q[nbr]
+    return cnt,np.array(changed,dtype = np.int64)
+
+
+def social_penalty(net,Type = 'B',lowest_n = None,rng = None):
+    '''
+    remove the player with lowest payoff and its neighbours,
+    replace them with random ones, in every replica.
+    lowest_n is np.argmin of the payoffs when the caller already has it
+    '''
+    if lowest_n is None:
+        lowest_n = np.argmin(net.payoff,axis = -1)
+    if net.replicas is not None:
+        edge_ids,sub_indptr = row_edges(net.indptr,lowest_n)
+        lowest_cluster = np.concatenate((net.indices[edge_ids],lowest_n))
+        replica_list = np.concatenate((np.repeat(np.arange(net.replicas),np.diff(sub_indptr)),np.arange(net.replicas)))
+        strategy_asigned(net,lowest_cluster,Type = Type,replica_list = replica_list,rng = rng)
+        return lowest_cluster
+    lowest_n = int(lowest_n)
+    lowest_cluster = np.append(net.neighbors(lowest_n),lowest_n)
+    strategy_asigned(net,lowest_cluster,Type = Type,rng = rng)
+    return lowest_cluster
@@ -0,0 +1,127 @@
+"""
+Content-addressed on-disk cache of generated networks
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+import checkpoint
+import seeding
+
+
+# stored next to indptr and indices, so a hit does not rebuild them privately
+derived = ('degree','src')
+
+
+def graph_key(params):
+    '''
+    hash of the generator parameters (including the seed), the name of the cache entry
+    '''
+    text = json.dumps(params,sort_keys = True)
+    return hashlib.sha256(text.encode()).hexdigest()[:20]
+
+
+def load_entry(entry_dir):
+    '''
+    CSRNetwork keyword arguments (indptr, indices, degree, src) as memory maps,
+    degree and src only when the entry holds them
+    '''
+    indptr,indices = checkpoint.load_topology(entry_dir)
+    arrays = {'indptr': indptr,'indices': indices}
+    for name in derived:
+        path = os.path.join(entry_dir,"topology",name+".npy")
+        if os.path.exists(path):
+            arrays[name] = np.load(path,mmap_mode = 'r')
+    return arrays
+
+
+class GraphCache():
+    '''
+    CSR adjacencies (indptr, indices, degree, src) stored as .npy files under cache_dir/<key>,
+    loaded memory-mapped. params should include the array layout (compact), so every
+    reader maps arrays of the dtypes it uses instead of casting a private copy.
+    least recently used entries are removed once the cache exceeds max_bytes
+    '''
+    def __init__(self,cache_dir = "./result/graph_cache",max_bytes = 8*2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir,exist_ok = True)
+
+    def entry_dir(self,key):
+        return os.path.join(self.cache_dir,key)
+
+    def get(self,params):
+        '''
+        load_entry of the cached graph, None on a miss
+        '''
+        entry_dir = self.entry_dir(graph_key(params))
+        if not checkpoint.has_topology(entry_dir):
+            return None
+        # the directory mtime is the last use
+        os.utime(entry_dir)
+        return load_entry(entry_dir)
+
+    def put(self,params,arrays):
+        '''
+        write to a temporary directory and rename it into place,
+        when another process stored the same graph first its copy is kept
+        '''
+        key = graph_key(params)
+        entry_dir = self.entry_dir(key)
+        tmp_dir = "{}.tmp{}".format(entry_dir,os.getpid())
+        os.makedirs(os.path.join(tmp_dir,"topology"),exist_ok = True)
+        for name in derived:
+            if name in arrays:
+                np.save(os.path.join(tmp_dir,"topology",name+".npy"),arrays[name])
+        # indices last, as in every topology directory
+        checkpoint.save_topology(tmp_dir,arrays['indptr'],arrays['indices'])
+        with open(os.path.join(tmp_dir,"params.json"),'w') as f:
+            json.dump(params,f)
+        try:
+            os.rename(tmp_dir,entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir,ignore_errors = True)
+        self.evict(keep = key)
+        return load_entry(entry_dir)
+
+    def get_or_build(self,params,build):
+        '''
+        cached graph for params, build() -> dict of CSRNetwork arrays runs on a miss
+        with random and np.random seeded by params['seed']
+        '''
+        cached = self.get(params)
+        if cached is not None:
+            return cached
+        return self.put(params,seeding.seeded_call(build,params['seed']))
+
+    def entries(self):
+        '''
+        (last use, size in bytes, key) of every complete entry
+        '''
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.entry_dir(key)
+            if ".tmp" in key or not checkpoint.has_topology(entry_dir):
+                continue
+            size = sum(os.path.getsize(os.path.join(root,fn)) for root,_,files in os.walk(entry_dir) for fn in files)
+            entries.append((os.path.getmtime(entry_dir),size,key))
+        return entries
+
+    def evict(self,keep = None):
+        entries = sorted(self.entries())
+        total = sum(size for _,size,_ in entries)
+        for _,size,key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                shutil.rmtree(self.entry_dir(key))
+            except OSError:
+                # still mapped by another process on some platforms
+                continue
+            total -= size
@@ -0,0 +1,141 @@
+"""
+Incremental payoff recomputation for the CSR engine
+"""
+
+import numpy as np
+
+import csr_engine
+
+
+class MinIndex():
+    '''
+    segment tree over payoffs, gives the lowest-payoff node
+    (first one on ties, as np.argmin) in O(log N)
+    '''
+    def __init__(self,values):
+        size = 1
+        while size < values.size:
+            size *= 2
+        self.size = size
+        self.tree = np.full(2*size,np.inf)
+        self.tree[size:size+values.size] = values
+        level = size//2
+        while level >= 1:
+            pos = np.arange(level,2*level)
+            self.tree[pos] = np.minimum(self.tree[2*pos],self.tree[2*pos+1])
+            level //= 2
+
+    def update(self,nodes,values):
+        '''
+        nodes must be sorted
+        '''
+        pos = nodes + self.size
+        self.tree[pos] = values
+        while pos.size and pos[0] > 1:
+            pos = pos//2
+            # parents of sorted positions stay sorted, drop repeats
+            keep = np.ones(pos.size,dtype = bool)
+            keep[1:] = pos[1:] != pos[:-1]
+            pos = pos[keep]
+            self.tree[pos] = np.minimum(self.tree[2*pos],self.tree[2*pos+1])
+
+    def argmin(self):
+        i = 1
+        tree = self.tree
+        while i < self.size:
+            i = 2*i if tree[2*i] <= tree[2*i+1] else 2*i+1
+        return i - self.size
+
+
+class IncrementalPlay():
+    '''
+    synchronous_play that re-evaluates only the edges of nodes
+    whose neighbourhood changed strategy since the last generation.
+    a node's payoff keeps moving while (payoff+gain)/k has not reached its fixed point,
+    so those nodes are updated as well, which keeps the result bit-identical to a full sweep.
+    falls back to a full sweep when more than dirty_threshold of the nodes need an update,
+    stale gain or moving payoff (under NS the moving payoffs alone are often half the network)
+    '''
+    def __init__(self,net,dirty_threshold = 0.25):
+        self.net = net
+        self.dirty_threshold = dirty_threshold
+        self.gain = None
+        self.active = None
+        self.min_index = None
+        self.dirty = []
+        self.dirty_fractions = [] # fraction of nodes updated (stale gain or moving payoff), every play
+        self.edges_evaluated = 0 # edges of the last play
+
+    def mark_dirty(self,nodes):
+        '''
+        nodes whose p or q changed since the last play
+        '''
+        self.dirty.append(np.asarray(nodes,dtype = np.int64))
+
+    def dirty_rows(self):
+        '''
+        changed nodes and their neighbours, i.e. every node whose gain is stale
+        '''
+        if not self.dirty:
+            return np.zeros(0,dtype = np.int64)
+        changed = np.unique(np.concatenate(self.dirty))
+        edge_ids,_ = csr_engine.row_edges(self.net.indptr,changed)
+        return np.union1d(changed,self.net.indices[edge_ids])
+
+    def full_play(self):
+        net = self.net
+        self.gain = csr_engine.segment_sum(csr_engine.edge_gain(net.p,net.q,net.src,net.indices),net.indptr,net.src)
+        self.edges_evaluated = net.indices.size
+        return np.arange(net.node_num)
+
+    def partial_play(self,rows):
+        '''
+        recompute the gain of the stale rows only
+        '''
+        net = self.net
+        edge_ids,sub_indptr = csr_engine.row_edges(net.indptr,rows)
+        gain = csr_engine.edge_gain(net.p,net.q,net.src[edge_ids],net.indices[edge_ids])
+        self.gain[rows] = csr_engine.segment_sum(gain,sub_indptr)
+        self.edges_evaluated = edge_ids.size
+
+    def play(self):
+        net = self.net
+        threshold = self.dirty_threshold*net.node_num
+        update = None
+        # the moving payoffs alone may already be too many, then the stale rows are not looked up
+        if self.gain is not None and self.active.size <= threshold:
+            rows = self.dirty_rows()
+            # nodes whose payoff is recomputed: stale gain, or still moving towards its fixed point
+            update = np.union1d(self.active,rows)
+            if update.size <= threshold:
+                self.partial_play(rows)
+            else:
+                update = None
+        if update is None:
+            update = self.full_play()
+        self.dirty = []
+        self.dirty_fractions.append(update.size/net.node_num)
+
+        old_payoff = net.payoff[update]
+        new_payoff = old_payoff + self.gain[update]
+        degree = net.degree[update]
+        nonzero = degree != 0
+        new_payoff[nonzero] /= degree[nonzero]
+        net.payoff[update] = new_payoff
+        self.active = update[new_payoff != old_payoff]
+
+        if self.min_index is not None:
+            self.min_index.update(update,new_payoff)
+        return update.size
+
+    def social_penalty(self,Type = 'B',rng = None):
+        '''
+        social penalty using the min index instead of a scan over all payoffs
+        '''
+        if self.min_index is None:
+            self.min_index = MinIndex(self.net.payoff)
+        lowest_n = self.min_index.argmin()
+        lowest_cluster = np.append(self.net.neighbors(lowest_n),lowest_n)
+        csr_engine.strategy_asigned(self.net,lowest_cluster,Type = Type,rng = rng)
+        self.mark_dirty(lowest_cluster)
+        return lowest_cluster
@@ -0,0 +1,147 @@
+"""
+Numba-compiled kernels for the CSR engine, NumPy fallback when numba is missing
+"""
+
+import numpy as np
+
+import counter_rng
+import csr_engine
+
+try:
+    import numba
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+def set_threads(threads):
+    '''
+    threads of the parallel kernels in this process, at most NUMBA_NUM_THREADS
+    '''
+    if HAVE_NUMBA:
+        numba.set_num_threads(max(1,min(threads,numba.config.NUMBA_NUM_THREADS)))
+
+
+if HAVE_NUMBA:
+
+    @numba.njit(parallel = True,cache = True)
+    def play_kernel(indptr,indices,p,q,payoff):
+        '''
+        every node accumulates its own payoff, edge by edge in CSR order,
+        each neighbour index is loaded once for all replicas (columns of p, q, payoff)
+        '''
+        replicas = p.shape[1]
+        for n in numba.prange(indptr.size-1):
+            for e in range(indptr[n],indptr[n+1]):
+                nbr = indices[e]
+                for r in range(replicas):
+                    if p[n,r] > q[nbr,r]:
+                        payoff[n,r] += 1-p[n,r]
+                    if p[nbr,r] > q[n,r]:
+                        payoff[n,r] += p[nbr,r]
+            k = indptr[n+1] - indptr[n]
+            if k != 0:
+                for r in range(replicas):
+                    payoff[n,r] /= k
+
+    @numba.njit(parallel = True,cache = True)
+    def selection_kernel(indptr,indices,payoff,u_nbr,u_adopt,src):
+        '''
+        neighbour each node copies from, -1 when it keeps its strategy,
+        for every replica (columns of payoff)
+        '''
+        replicas = payoff.shape[1]
+        for n in numba.prange(indptr.size-1):
+            k = indptr[n+1] - indptr[n]
+            for r in range(replicas):
+                src[n,r] = -1
+                if k == 0:
+                    continue
+                nbr = indices[indptr[n] + min(int(u_nbr[n,r]*k),k-1)]
+                payoff_diff = payoff[nbr,r] - payoff[n,r]
+                if payoff_diff > 0:
+                    k_nbr = indptr[nbr+1] - indptr[nbr]
+                    if u_adopt[n,r] < payoff_diff/(2*max(k,k_nbr)):
+                        src[n,r] = nbr
+
+    @numba.njit(cache = True)
+    def sequential_selection_kernel(indptr,indices,p,q,payoff,u_nbr,u_adopt,changed):
+        '''
+        node by node natural selection, later nodes see earlier adoptions
+        '''
+        cnt = 0
+        n_changed = 0
+        for n in range(indptr.size-1):
+            k = indptr[n+1] - indptr[n]
+            if k == 0:
+                continue
+            nbr = indices[indptr[n] + min(int(u_nbr[n]*k),k-1)]
+            payoff_diff = payoff[nbr] - payoff[n]
+            if payoff_diff > 0:
+                k_nbr = indptr[nbr+1] - indptr[nbr]
+                if u_adopt[n] < payoff_diff/(2*max(k,k_nbr)):
+                    cnt += 1
+                    if p[n] != p[nbr] or q[n] != q[nbr]:
+                        changed[n_changed] = n
+                        n_changed += 1
+                    p[n] = p[nbr]
+                    q[n] = q[nbr]
+        return cnt,n_changed
+
+    @numba.njit(cache = True)
+    def lowest_cluster_kernel(indptr,indices,payoff):
+        '''
+        lowest-payoff node (first one on ties) and its neighbours
+        '''
+        lowest_n = 0
+        for n in range(1,payoff.size):
+            if payoff[n] < payoff[lowest_n]:
+                lowest_n = n
+        k = indptr[lowest_n+1] - indptr[lowest_n]
+        cluster = np.empty(k+1,dtype = np.int64)
+        cluster[:k] = indices[indptr[lowest_n]:indptr[lowest_n+1]]
+        cluster[k] = lowest_n
+        return cluster
+
+    def node_major(x):
+        '''
+        node_num x replicas view, a single population is one column
+        '''
+        return x.T if x.ndim == 2 else x[:,None]
+
+    def synchronous_play(net):
+        play_kernel(net.indptr,net.indices,node_major(net.p),node_major(net.q),node_major(net.payoff))
+
+    def natural_selection(net,rng = None):
+        '''
+        same random draws and result as csr_engine.natural_selection
+        '''
+        shape = net.p.shape
+        u_nbr = csr_engine.uniform(rng,counter_rng.NBR,shape)
+        u_adopt = csr_engine.uniform(rng,counter_rng.ADOPT,shape)
+        src = np.empty(shape,dtype = np.int64,order = 'F')
+        selection_kernel(net.indptr,net.indices,node_major(net.payoff),node_major(u_nbr),node_major(u_adopt),node_major(src))
+        return csr_engine.apply_adoptions(net,src)
+
+    def natural_selection_sequential(net,rng = None):
+        '''
+        node by node natural selection with batched random draws
+        '''
+        u_nbr = csr_engine.uniform(rng,counter_rng.NBR,(net.node_num,))
+        u_adopt = csr_engine.uniform(rng,counter_rng.ADOPT,(net.node_num,))
+        changed = np.empty(net.node_num,dtype = np.int64)
+        cnt,n_changed = sequential_selection_kernel(net.indptr,net.indices,net.p,net.q,net.payoff,u_nbr,u_adopt,changed)
+        return cnt,changed[:n_changed]
+
+    def social_penalty(net,Type = 'B',rng = None):
+        if net.replicas is not None:
+            return csr_engine.social_penalty(net,Type = Type,rng = rng)
+        lowest_cluster = lowest_cluster_kernel(net.indptr,net.indices,net.payoff)
+        csr_engine.strategy_asigned(net,lowest_cluster,Type = Type,rng = rng)
+        return lowest_cluster
+
+else:
+    synchronous_play = csr_engine.synchronous_play
+    natural_selection = csr_engine.natural_selection
+    natural_selection_sequential = csr_engine.natural_selection_sequential
+    social_penalty = csr_engine.social_penalty
@@ -0,0 +1,131 @@
+"""
+Vectorized p/q histograms and running moments of Ultimatum Game in complex network
+"""
+
+import numpy as np
+
+x_axis = np.arange(0,1.05,1/20) # 21 descrete points,range 0~1,step size 0.05
+
+
+def window_histogram(value_list,groups = None,group_num = 1):
+    '''
+    number of values within 0.05 of every point of x_axis (windows overlap),
+    same counts as the former double loop of pq_distribution.
+    with groups (one group id per value) it returns a group_num x 21 histogram
+    '''
+    values = np.ravel(np.asarray(value_list,dtype = np.float64))
+    grouped = groups is not None
+    groups = np.ravel(groups) if grouped else np.zeros(values.size,dtype = np.int64)
+    lower = np.floor(values*20).astype(np.int64)
+    y_axis = np.zeros(group_num*x_axis.size)
+    # only the grid points next to a value can be within 0.05 of it
+    for shift in (-1,0,1,2):
+        i = lower + shift
+        valid = (i >= 0) & (i < x_axis.size)
+        i = i[valid]
+        hit = np.abs(values[valid] - x_axis[i]) < 0.05
+        y_axis += np.bincount(groups[valid][hit]*x_axis.size + i[hit],minlength = y_axis.size)
+    return y_axis.reshape(group_num,x_axis.size) if grouped else y_axis
+
+
+def histogram_moments(value_list):
+    '''
+    window_histogram, mean and variance of values in [0, 1] from one bincount of floor(20*v):
+    window k holds bins k-1 and k, values within 1e-9 of a bin edge are counted by window_histogram
+    '''
+    values = np.ravel(np.asarray(value_list,dtype = np.float64),order = 'K')
+    scaled = values*20
+    lower = np.floor(scaled)
+    edge = (scaled - lower < 1e-9) | (lower + 1 - scaled < 1e-9)
+    on_edge = edge.any()
+    if on_edge:
+        lower = lower[~edge]
+    bins = np.bincount(lower.astype(np.int64),minlength = x_axis.size)
+    y_axis = bins[:x_axis.size].astype(np.float64)
+    y_axis[1:] += bins[:x_axis.size-1]
+    if on_edge:
+        y_axis += window_histogram(values[edge])
+    mean = values.sum()/values.size
+    var = max(np.dot(values,values)/values.size - mean*mean,0.0)
+    return y_axis,mean,var
+
+
+def degree_class(degree):
+    '''
+    log2 degree bins: 0 for isolated nodes, c for 2**(c-1) <= degree < 2**c
+    '''
+    return np.frexp(np.asarray(degree,dtype = np.float64))[1].astype(np.int64)
+
+
+class RunningStats():
+    '''
+    histogram, mean and variance of p or q accumulated over epochs and replicas,
+    overall and per degree class. batches are merged with the pairwise
+    Welford update (Chan et al.), so the result does not depend on batch sizes
+    '''
+    def __init__(self,class_num = 64):
+        self.class_num = class_num
+        self.count = np.zeros(class_num)
+        self.mean = np.zeros(class_num)
+        self.m2 = np.zeros(class_num)
+        self.hist = np.zeros((class_num,x_axis.size))
+
+    def update(self,values,degree = None):
+        '''
+        values of all nodes, (node_num,) or (replicas,node_num),
+        degree of every node, all nodes share class 0 when it is None
+        '''
+        values = np.asarray(values,dtype = np.float64)
+        if degree is None:
+            classes = np.zeros(values.shape,dtype = np.int64)
+        else:
+            classes = np.broadcast_to(degree_class(degree),values.shape)
+        values = values.ravel()
+        classes = classes.ravel()
+        count = np.bincount(classes,minlength = self.class_num).astype(np.float64)
+        total = np.bincount(classes,values,minlength = self.class_num)
+        mean = np.divide(total,count,out = np.zeros(self.class_num),where = count > 0)
+        m2 = np.bincount(classes,(values - mean[classes])**2,minlength = self.class_num)
+        self.merge_moments(count,mean,m2)
+        self.hist += window_histogram(values,classes,self.class_num)
+        return self
+
+    def merge(self,other):
+        '''
+        combine with stats accumulated elsewhere (other replicas or processes)
+        '''
+        self.merge_moments(other.count,other.mean,other.m2)
+        self.hist += other.hist
+        return self
+
+    def merge_moments(self,count,mean,m2):
+        new_count = self.count + count
+        nonempty = new_count > 0
+        ratio = np.divide(count,new_count,out = np.zeros(self.class_num),where = nonempty)
+        delta = mean - self.mean
+        self.mean = self.mean + delta*ratio
+        self.m2 = self.m2 + m2 + delta**2*self.count*ratio
+        self.count = new_count
+
+    def classes(self):
+        '''
+        degree classes that received any value
+        '''
+        return np.nonzero(self.count)[0]
+
+    def var(self):
+        '''
+        population variance per degree class
+        '''
+        return np.divide(self.m2,self.count,out = np.full(self.class_num,np.nan),where = self.count > 0)
+
+    def total(self):
+        '''
+        (count, mean, variance, histogram) over all degree classes
+        '''
+        count = self.count.sum()
+        if count == 0:
+            return 0.0,np.nan,np.nan,np.zeros(x_axis.size)
+        mean = (self.count*self.mean).sum()/count
+        m2 = (self.m2 + self.count*(self.mean - mean)**2).sum()
+        return count,mean,m2/count,self.hist.sum(axis = 0)
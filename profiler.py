@@ -0,0 +1,158 @@
+"""
+Per-phase timers and throughput counters of the epoch loop of Ultimatum Game in complex network
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class PhaseTimer():
+    '''
+    context manager timing one phase, adds its wall time to the profiler
+    '''
+    __slots__ = ('profiler','name','start')
+
+    def __init__(self,profiler,name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        self.profiler.add_time(self.name,self.start,time.perf_counter())
+        return False
+
+
+class Profiler():
+    '''
+    wall time per phase (play, update, stats, save) and event counters
+    (edges evaluated, adoptions, SP cluster sizes, bytes written).
+    a summary of the last summary_interval epochs is printed by end_epoch,
+    with trace_path every phase is also recorded as a Chrome trace event
+    (chrome://tracing or ui.perfetto.dev), up to max_events of them
+    '''
+    enabled = True
+
+    def __init__(self,summary_interval = 100,trace_path = None,max_events = 10**6):
+        self.summary_interval = summary_interval
+        self.trace_path = trace_path
+        self.max_events = max_events
+        self.origin = time.perf_counter()
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.maxima = {}
+        self.events = []
+        self.epoch = None
+        self.last = (self.origin,{},{})
+
+    def phase(self,name):
+        return PhaseTimer(self,name)
+
+    def add_time(self,name,start,end):
+        self.times[name] = self.times.get(name,0.0) + end - start
+        self.calls[name] = self.calls.get(name,0) + 1
+        if self.trace_path is not None and len(self.events) < self.max_events:
+            self.events.append({'name': name,'ph': 'X','ts': (start - self.origin)*1e6,'dur': (end - start)*1e6,
+                                'pid': os.getpid(),'tid': threading.get_ident(),'args': {'epoch': self.epoch}})
+
+    def count(self,name,n = 1):
+        self.counters[name] = self.counters.get(name,0) + n
+
+    def high(self,name,value):
+        '''
+        keep the largest value seen, e.g. the biggest SP cluster
+        '''
+        self.maxima[name] = max(self.maxima.get(name,value),value)
+
+    def begin_epoch(self,Epoch):
+        self.epoch = Epoch
+
+    def end_epoch(self,Epoch):
+        if self.summary_interval and Epoch % self.summary_interval == 0:
+            self.print_summary(Epoch)
+
+    def interval(self):
+        '''
+        seconds, phase times and counters since the last summary
+        '''
+        now = time.perf_counter()
+        last_time,last_times,last_counters = self.last
+        times = {name: t - last_times.get(name,0.0) for name,t in self.times.items()}
+        counters = {name: c - last_counters.get(name,0) for name,c in self.counters.items()}
+        self.last = (now,dict(self.times),dict(self.counters))
+        return now - last_time,times,counters
+
+    def print_summary(self,Epoch):
+        seconds,times,counters = self.interval()
+        line = ", ".join("{} {:.1f}%".format(name,100*t/seconds) for name,t in times.items())
+        rates = ", ".join("{} {:.3g}/s".format(name,c/seconds) for name,c in counters.items())
+        print("profile Epoch[{}]: {:.3f} s, {}; {}".format(Epoch,seconds,line,rates))
+        if self.trace_path is not None and len(self.events) < self.max_events:
+            self.events.append({'name': 'counters','ph': 'C','ts': (time.perf_counter() - self.origin)*1e6,
+                                'pid': os.getpid(),'args': counters})
+
+    def summary(self):
+        '''
+        totals since the profiler was created
+        '''
+        return {
+            'seconds': time.perf_counter() - self.origin,
+            'phases': {name: {'seconds': t,'calls': self.calls[name]} for name,t in self.times.items()},
+            'counters': dict(self.counters),
+            'maxima': dict(self.maxima),
+        }
+
+    def close(self):
+        '''
+        write the trace file and the totals next to it
+        '''
+        if self.trace_path is None:
+            return
+        with open(self.trace_path,'w') as f:
+            json.dump({'traceEvents': self.events,'displayTimeUnit': 'ms','summary': self.summary()},f)
+
+
+class NullProfiler():
+    '''
+    stands in when profiling is off, every hook is a no-op
+    '''
+    enabled = False
+
+    def __init__(self):
+        self.timer = NullTimer()
+
+    def phase(self,name):
+        return self.timer
+
+    def count(self,name,n = 1):
+        pass
+
+    def high(self,name,value):
+        pass
+
+    def begin_epoch(self,Epoch):
+        pass
+
+    def end_epoch(self,Epoch):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullTimer():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+
+disabled = NullProfiler()
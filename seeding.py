@@ -0,0 +1,66 @@
+"""
+Independent seed streams of Ultimatum Game in complex network
+"""
+
+import random
+
+import numpy as np
+
+
+def seed_global(seed):
+    '''
+    seed random and np.random, seeds below 2**32 as np.random.seed(seed),
+    larger ones through their 32-bit words
+    '''
+    random.seed(seed)
+    if 0 <= seed < 2**32:
+        np.random.seed(seed)
+    else:
+        words = []
+        while seed:
+            words.append(seed & 0xFFFFFFFF)
+            seed >>= 32
+        np.random.seed(np.array(words,dtype = np.uint32))
+
+
+def seeded_call(fn,seed):
+    '''
+    run fn() with random and np.random seeded by seed, and restore both afterwards,
+    so the caller's random streams do not depend on what fn drew
+    '''
+    py_state = random.getstate()
+    np_state = np.random.get_state()
+    seed_global(seed)
+    try:
+        return fn()
+    finally:
+        random.setstate(py_state)
+        np.random.set_state(np_state)
+
+
+class SeedStreams():
+    '''
+    seeds of the graph, the initial strategies and the dynamics of one run,
+    spawned from SeedSequence(entropy, spawn_key) so they are independent of each other
+    and of every other spawn_key: a sweep gives run k spawn_key (k,) under one sweep seed,
+    and any run can be repeated on its own from (entropy, spawn_key).
+    entropy None draws fresh entropy from the OS
+    '''
+    def __init__(self,entropy = None,spawn_key = ()):
+        if isinstance(spawn_key,int):
+            spawn_key = (spawn_key,)
+        self.root = np.random.SeedSequence(entropy,spawn_key = tuple(spawn_key))
+        # graph, strategy and dynamics, in spawn order
+        seeds = []
+        for child in self.root.spawn(3):
+            # 64-bit integer seed of the child stream
+            low,high = child.generate_state(2,np.uint32)
+            seeds.append(int(low) | int(high) << 32)
+        self.graph,self.strategy,self.dynamics = seeds
+
+    def manifest(self):
+        '''
+        what is recorded in a run's manifest, SeedStreams(entropy, spawn_key) rebuilds it
+        '''
+        return {'entropy': self.root.entropy,'spawn_key': list(self.root.spawn_key),
+                'graph': self.graph,'strategy': self.strategy,'dynamics': self.dynamics}
@@ -0,0 +1,341 @@
+"""
+Graph-partitioned multi-process engine with halo exchange for Ultimatum Game in complex network
+"""
+
+import atexit
+import multiprocessing
+import traceback
+
+import numpy as np
+
+import counter_rng
+import csr_engine
+import shared_topology
+
+
+def bfs_order(indptr,indices):
+    '''
+    nodes in breadth-first order from node 0, level by level,
+    nodes outside its component follow in id order
+    '''
+    node_num = indptr.size - 1
+    visited = np.zeros(node_num,dtype = bool)
+    order = []
+    frontier = np.zeros(min(node_num,1),dtype = np.int64)
+    visited[frontier] = True
+    while frontier.size:
+        order.append(frontier)
+        edge_ids,_ = csr_engine.row_edges(indptr,frontier)
+        frontier = np.unique(indices[edge_ids])
+        frontier = frontier[~visited[frontier]]
+        visited[frontier] = True
+    order.append(np.nonzero(~visited)[0])
+    return np.concatenate(order)
+
+
+def partition(indptr,indices,shards):
+    '''
+    shard of every node: the BFS order cut into shards pieces with about
+    the same number of edges, neighbouring nodes mostly land in the same shard
+    '''
+    indptr = np.asarray(indptr,dtype = np.int64)
+    order = bfs_order(indptr,indices)
+    work = np.cumsum(np.diff(indptr)[order] + 1)
+    owner = np.empty(order.size,dtype = np.int64)
+    owner[order] = np.minimum(work*shards//(work[-1] + 1),shards - 1) if order.size else 0
+    return owner
+
+
+def build_shards(indptr,indices,owner,shards):
+    '''
+    local CSR of every shard: rows of its owned nodes (ascending ids, same neighbour order),
+    indices renumbered to owned nodes first, then halo nodes (neighbours owned elsewhere).
+    boundary nodes are owned nodes that are in some other shard's halo, their values are
+    published in the shard's outbox; halo_sources tell where each halo value is read from
+    '''
+    indptr = np.asarray(indptr,dtype = np.int64)
+    degree = np.diff(indptr)
+    local = np.full(indptr.size - 1,-1,dtype = np.int64)
+    parts = []
+    for s in range(shards):
+        owned = np.nonzero(owner == s)[0]
+        edge_ids,local_indptr = csr_engine.row_edges(indptr,owned)
+        nbrs = indices[edge_ids]
+        halo = np.unique(nbrs[owner[nbrs] != s])
+        nodes = np.concatenate([owned,halo])
+        local[nodes] = np.arange(nodes.size)
+        parts.append({'owned': owned,'halo': halo,'indptr': local_indptr,'indices': local[nbrs],
+                      'degree': degree[nodes],'src': np.repeat(np.arange(owned.size),degree[owned])})
+        local[nodes] = -1
+    for s,part in enumerate(parts):
+        part['boundary'] = np.unique(np.concatenate([t['halo'][owner[t['halo']] == s] for t in parts]))
+    for part in parts:
+        sources = []
+        halo_owner = owner[part['halo']]
+        for t in np.unique(halo_owner):
+            at = np.nonzero(halo_owner == t)[0]
+            sources.append((int(t),part['owned'].size + at,np.searchsorted(parts[t]['boundary'],part['halo'][at])))
+        part['halo_sources'] = sources
+    return parts
+
+
+class Shard():
+    '''
+    state of one worker: p, q and payoff of its owned nodes followed by its halo
+    '''
+    def __init__(self,shard,shards,part,spec,barrier):
+        self.__dict__.update(part)
+        self.shard = shard
+        self.barrier = barrier
+        self.shared = shared_topology.attach(spec,writeable = True)
+        self.outboxes = [self.shared["outbox{}".format(t)] for t in range(shards)]
+        self.n = self.owned.size
+        self.nodes = np.concatenate([self.owned,self.halo])
+        self.boundary_local = np.searchsorted(self.owned,self.boundary)
+        self.rng = None
+        self.p = self.shared['p'][self.nodes]
+        self.q = self.shared['q'][self.nodes]
+        self.payoff = self.shared['payoff'][self.nodes]
+
+    def exchange(self,rows):
+        '''
+        publish boundary values of the given rows (0 p, 1 q, 2 payoff), wait for
+        every shard, then read the halo values from their outboxes
+        '''
+        values = (self.p,self.q,self.payoff)
+        outbox = self.outboxes[self.shard]
+        for row in rows:
+            outbox[row] = values[row][self.boundary_local]
+        self.barrier.wait()
+        for t,local,at in self.halo_sources:
+            for row in rows:
+                values[row][local] = self.outboxes[t][row,at]
+
+    def play(self):
+        '''
+        csr_engine.synchronous_play on the owned rows
+        '''
+        gain = csr_engine.segment_sum(csr_engine.edge_gain(self.p,self.q,self.src,self.indices),self.indptr,self.src)
+        payoff = self.payoff[:self.n]
+        payoff += gain
+        degree = self.degree[:self.n]
+        nonzero = degree != 0
+        payoff[nonzero] /= degree[nonzero]
+
+    def natural_selection(self,seed = None,epoch = 0):
+        '''
+        csr_engine.natural_selection on the owned nodes with their slice of the global draws,
+        or their own counter-based draws given the seed of a CounterRNG,
+        neighbour payoffs come from the halo, adoptions copy last generation's strategies
+        '''
+        self.exchange((2,))
+        n = self.n
+        if seed is None:
+            u_nbr = self.shared['u_nbr'][self.owned]
+            u_adopt = self.shared['u_adopt'][self.owned]
+        else:
+            if self.rng is None or self.rng.seed != seed:
+                self.rng = counter_rng.CounterRNG(seed)
+            self.rng.epoch = epoch
+            u_nbr = self.rng.at(counter_rng.NBR,self.owned)
+            u_adopt = self.rng.at(counter_rng.ADOPT,self.owned)
+        degree = self.degree[:n]
+        count,changed = 0,np.zeros(0,dtype = np.int64)
+        # every shard takes part in both exchanges, even without edges
+        if self.indices.size:
+            offset = np.minimum((u_nbr*degree).astype(np.int64),np.maximum(degree-1,0))
+            nbr = self.indices[np.minimum(self.indptr[:-1] + offset,self.indices.size-1)]
+            payoff_diff = self.payoff[nbr] - self.payoff[:n]
+            probs_adopt = payoff_diff/(2*np.maximum(np.maximum(degree,self.degree[nbr]),1))
+            adopt = (degree > 0) & (payoff_diff > 0) & (u_adopt < probs_adopt)
+            # local indices, halo nodes are only read
+            count,changed = csr_engine.apply_adoptions(self,np.where(adopt,nbr,-1))
+            changed = self.owned[changed]
+        self.exchange((0,1))
+        return count,changed
+
+    def lowest(self):
+        '''
+        lowest payoff of the owned nodes and its global id (first one on ties)
+        '''
+        if self.n == 0:
+            return np.inf,-1
+        i = int(np.argmin(self.payoff[:self.n]))
+        return self.payoff[i],int(self.owned[i])
+
+    def assign(self,cluster,p,q):
+        '''
+        new strategies of a social penalty cluster, owned and halo copies alike
+        '''
+        for nodes,offset in ((self.owned,0),(self.halo,self.n)):
+            held = np.isin(cluster,nodes)
+            local = np.searchsorted(nodes,cluster[held]) + offset
+            self.p[local] = p[held]
+            self.q[local] = q[held]
+            self.payoff[local] = 0
+
+    def pull(self):
+        '''
+        owned values into the global arrays the host reads
+        '''
+        for field in ('p','q','payoff'):
+            self.shared[field][self.owned] = getattr(self,field)[:self.n]
+
+    def push(self):
+        '''
+        owned and halo values from the global arrays the host wrote
+        '''
+        for field in ('p','q','payoff'):
+            getattr(self,field)[:] = self.shared[field][self.nodes]
+
+
+def shard_worker(conn,barrier,shard,shards,part,spec):
+    state = Shard(shard,shards,part,spec,barrier)
+    while True:
+        command,args = conn.recv()
+        if command == 'close':
+            conn.close()
+            return
+        try:
+            conn.send(('ok',getattr(state,command)(*args)))
+        except BaseException:
+            # release the shards waiting at the barrier for this one
+            barrier.abort()
+            conn.send(('error',traceback.format_exc()))
+
+
+class ShardedEngine():
+    '''
+    one population split over shards worker processes: the CSR graph is partitioned
+    (BFS order cut into pieces of equal edge count), every worker owns p, q and payoff
+    of its nodes plus a halo copy of their neighbours owned elsewhere, and after each
+    step only boundary values go through shared-memory outboxes.
+    random numbers are drawn here in node order and social penalty uses a parallel
+    argmin reduction, so results equal the csr engine for the same seeds.
+    the host network's p, q and payoff become views of shared arrays, current after pull()
+    '''
+    def __init__(self,shards = None):
+        self.shards = shards or multiprocessing.cpu_count()
+        self.net = None
+        self.shared = None
+        self.barrier = None
+        self.workers = []
+        atexit.register(self.close)
+
+    def start(self,net):
+        '''
+        partition net and start the workers, its current state is scattered to them
+        '''
+        self.close()
+        if net.replicas is not None:
+            raise ValueError("the sharded engine runs a single population")
+        owner = partition(net.indptr,net.indices,self.shards)
+        parts = build_shards(net.indptr,net.indices,owner,self.shards)
+        arrays = {'p': net.p,'q': net.q,'payoff': net.payoff,
+                  'u_nbr': np.zeros(net.node_num),'u_adopt': np.zeros(net.node_num)}
+        for t,part in enumerate(parts):
+            arrays["outbox{}".format(t)] = np.zeros((3,part['boundary'].size),dtype = net.p.dtype)
+        self.shared = shared_topology.SharedArrays(arrays)
+        context = multiprocessing.get_context("spawn")
+        # kept here, the workers attach to it while they start
+        self.barrier = context.Barrier(self.shards)
+        for t,part in enumerate(parts):
+            conn,child = context.Pipe()
+            process = context.Process(target = shard_worker,args = (child,self.barrier,t,self.shards,part,self.shared.spec),
+                                      daemon = True)
+            process.start()
+            self.workers.append((process,conn))
+        net.p = self.shared.arrays['p']
+        net.q = self.shared.arrays['q']
+        net.payoff = self.shared.arrays['payoff']
+        self.net = net
+
+    def call(self,command,*args):
+        '''
+        run command on every shard, results in shard order
+        '''
+        for _,conn in self.workers:
+            conn.send((command,args))
+        replies = [conn.recv() for _,conn in self.workers]
+        for status,result in replies:
+            if status == 'error':
+                raise RuntimeError("shard failed:\n" + result)
+        return [result for _,result in replies]
+
+    def attach(self,net):
+        if self.net is not net:
+            self.start(net)
+
+    def synchronous_play(self,net):
+        self.attach(net)
+        self.call('play')
+
+    def natural_selection(self,net,rng = None):
+        self.attach(net)
+        if rng is None:
+            # same draws, in the same order, as csr_engine.natural_selection
+            self.shared.arrays['u_nbr'][:] = np.random.rand(net.node_num)
+            self.shared.arrays['u_adopt'][:] = np.random.rand(net.node_num)
+            results = self.call('natural_selection')
+        else:
+            # counter-based draws need no coordination, every shard makes its own
+            results = self.call('natural_selection',rng.seed,rng.epoch)
+        cnt = sum(c for c,_ in results)
+        return cnt,np.sort(np.concatenate([changed for _,changed in results]))
+
+    def natural_selection_sequential(self,net,rng = None):
+        raise ValueError("the sharded engine has no sequential natural selection")
+
+    def social_penalty(self,net,Type = 'B',rng = None):
+        '''
+        lowest payoff by a reduction over the shards' minima, ties go to the lowest id as in np.argmin,
+        the new strategies are drawn here and sent to the shards holding the cluster
+        '''
+        self.attach(net)
+        lowest = self.call('lowest')
+        lowest_n = min(lowest)[1]
+        lowest_cluster = np.append(net.neighbors(lowest_n),lowest_n)
+        csr_engine.strategy_asigned(net,lowest_cluster,Type = Type,rng = rng)
+        self.call('assign',lowest_cluster,net.p[lowest_cluster],net.q[lowest_cluster])
+        return lowest_cluster
+
+    def pull(self,net):
+        '''
+        gather the shards' state into net.p, net.q and net.payoff
+        '''
+        if self.net is net:
+            self.call('pull')
+
+    def push(self,net):
+        '''
+        scatter net.p, net.q and net.payoff, changed on the host, to the shards
+        '''
+        if self.net is net:
+            self.call('push')
+
+    def close(self):
+        '''
+        stop the workers, the host network keeps a private copy of the last state
+        '''
+        if self.workers and self.net is not None:
+            try:
+                self.call('pull')
+            except (OSError,EOFError,RuntimeError):
+                print("sharded engine: could not gather the last state")
+        for process,conn in self.workers:
+            try:
+                conn.send(('close',()))
+            except OSError:
+                pass
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self.workers = []
+        if self.net is not None:
+            self.net.p = np.array(self.net.p)
+            self.net.q = np.array(self.net.q)
+            self.net.payoff = np.array(self.net.payoff)
+            self.net = None
+        if self.shared is not None:
+            self.shared.close()
+            self.shared = None
@@ -0,0 +1,65 @@
+"""
+Read-only network topology in shared memory for multiprocess sweeps
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# topology arrays of a CSRNetwork, all workers read the same copy
+fields = ('indptr','indices','degree','src')
+
+# blocks attached by this process, they must stay open while their arrays are in use
+attached = []
+
+
+class SharedArrays():
+    '''
+    copies named arrays into shared memory blocks,
+    spec (block names, shapes and dtypes) is what workers need to attach.
+    the creating process owns the blocks and removes them with close()
+    '''
+    def __init__(self,arrays):
+        self.blocks = []
+        self.spec = {}
+        self.arrays = {}
+        for field,array in arrays.items():
+            array = np.asarray(array)
+            block = shared_memory.SharedMemory(create = True,size = max(array.nbytes,1))
+            self.arrays[field] = np.ndarray(array.shape,array.dtype,buffer = block.buf)
+            self.arrays[field][:] = array
+            self.blocks.append(block)
+            self.spec[field] = (block.name,array.shape,array.dtype.str)
+
+    def nbytes(self):
+        return sum(block.size for block in self.blocks)
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+class SharedTopology(SharedArrays):
+    '''
+    the topology arrays of a CSRNetwork in shared memory
+    '''
+    def __init__(self,net):
+        SharedArrays.__init__(self,{field: getattr(net,field) for field in fields})
+
+
+def attach(spec,writeable = False):
+    '''
+    arrays backed by the shared blocks, read-only unless writeable,
+    for a SharedTopology these are keyword arguments of CSRNetwork
+    '''
+    arrays = {}
+    for field,(name,shape,dtype) in spec.items():
+        block = shared_memory.SharedMemory(name = name)
+        attached.append(block)
+        array = np.ndarray(shape,dtype,buffer = block.buf)
+        array.flags.writeable = writeable
+        arrays[field] = array
+    return arrays
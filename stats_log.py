@@ -0,0 +1,116 @@
+"""
+Streaming per-epoch statistics of Ultimatum Game in complex network
+"""
+
+import json
+import os
+
+import numpy as np
+
+from pq_stats import histogram_moments,x_axis
+
+quantile_levels = np.array([0,0.05,0.25,0.5,0.75,0.95,1])
+
+# column name, dtype, shape of one record
+columns = [('epoch',np.int64,()),('adoptions',np.int64,()),('changes',np.int64,())]
+for attr_name in ('p','q'):
+    columns += [(attr_name+'_hist',np.float64,(x_axis.size,)),
+                (attr_name+'_mean',np.float64,()),
+                (attr_name+'_var',np.float64,()),
+                (attr_name+'_quantiles',np.float64,(quantile_levels.size,))]
+
+
+def epoch_record(Epoch,p,q,adoptions,changes = 0,quantiles = True):
+    '''
+    adoptions counts every copy (or re-seeded player under SP),
+    changes only the players whose p or q actually changed.
+    the quantiles (a partition of all values) are NaN unless quantiles is set
+    '''
+    record = {'epoch': Epoch,'adoptions': adoptions,'changes': changes}
+    for attr_name,values in (('p',p),('q',q)):
+        hist,mean,var = histogram_moments(values)
+        record[attr_name+'_hist'] = hist
+        record[attr_name+'_mean'] = mean
+        record[attr_name+'_var'] = var
+        if quantiles:
+            record[attr_name+'_quantiles'] = np.quantile(np.ravel(values,order = 'K'),quantile_levels)
+        else:
+            record[attr_name+'_quantiles'] = np.full(quantile_levels.size,np.nan)
+    return record
+
+
+class StatsLog():
+    '''
+    append-only columnar log, one raw binary file per column under run_dir/stats.
+    records at or after start_epoch (left by an interrupted run) are dropped on open
+    '''
+    def __init__(self,run_dir,start_epoch = 1,buffer_size = 100):
+        self.stats_dir = os.path.join(run_dir,"stats")
+        os.makedirs(self.stats_dir,exist_ok = True)
+        kept = 0
+        if has_stats(run_dir):
+            stats = read_stats(run_dir)
+            kept = int(np.searchsorted(stats['epoch'],start_epoch))
+            # release the maps before truncating the files
+            del stats
+        schema = {name: {'dtype': np.dtype(dtype).str,'shape': list(shape)} for name,dtype,shape in columns}
+        with open(os.path.join(self.stats_dir,"schema.json"),'w') as f:
+            json.dump(schema,f)
+        self.files = {}
+        for name,dtype,shape in columns:
+            path = os.path.join(self.stats_dir,name+".bin")
+            f = open(path,'ab')
+            f.truncate(kept*np.dtype(dtype).itemsize*int(np.prod(shape)))
+            self.files[name] = f
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def append(self,Epoch,p,q,adoptions,changes = 0,quantiles = True):
+        self.append_record(epoch_record(Epoch,p,q,adoptions,changes,quantiles))
+
+    def append_record(self,record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        for name,dtype,shape in columns:
+            column = np.array([record[name] for record in self.buffer],dtype = dtype)
+            self.files[name].write(column.tobytes())
+            self.files[name].flush()
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+
+def has_stats(run_dir):
+    return os.path.exists(os.path.join(run_dir,"stats","schema.json"))
+
+
+def read_stats(run_dir):
+    '''
+    memory-mapped columns, every one with one row per logged epoch
+    '''
+    stats_dir = os.path.join(run_dir,"stats")
+    with open(os.path.join(stats_dir,"schema.json")) as f:
+        schema = json.load(f)
+    record_size = {}
+    for name,info in schema.items():
+        row_bytes = np.dtype(info['dtype']).itemsize*int(np.prod(info['shape']))
+        path = os.path.join(stats_dir,name+".bin")
+        record_size[name] = (path,row_bytes)
+    # a crash can leave columns of unequal length, keep the complete records
+    n = min(os.path.getsize(path)//row_bytes if os.path.exists(path) else 0 for path,row_bytes in record_size.values())
+    stats = {}
+    for name,info in schema.items():
+        shape = (n,) + tuple(info['shape'])
+        if n == 0:
+            stats[name] = np.zeros(shape,dtype = info['dtype'])
+        else:
+            stats[name] = np.memmap(record_size[name][0],dtype = info['dtype'],mode = 'r',shape = shape)
+    return stats
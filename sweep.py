@@ -0,0 +1,222 @@
+"""
+Parallel parameter sweep of Ultimatum Game in complex network
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import random
+import time
+import traceback
+
+import numpy as np
+
+import checkpoint
+import kernels
+import shared_topology
+from UG_Complex_Network import UG_Complex_Network
+
+
+def expand_grid(grid):
+    '''
+    one config per combination of the grid values, in grid order
+    '''
+    keys = list(grid.keys())
+    return [dict(zip(keys,values)) for values in itertools.product(*[grid[k] for k in keys])]
+
+
+def run_name(config):
+    return "{}_{}_{}_k{}_n{}_s{}".format(config['network_type'],config['player_type'],config['update_rule'],
+                                        config['avg_degree'],config['node_num'],config['seed'])
+
+
+def run_dir(sweep_name,config):
+    '''
+    check point name of a run, relative to ./result
+    '''
+    return os.path.join("sweep",sweep_name,run_name(config))
+
+
+def is_finished(sweep_name,config):
+    return os.path.exists(os.path.join("./result",run_dir(sweep_name,config),"done.json"))
+
+
+def topology_key(config):
+    return (config['network_type'],config['node_num'],config['avg_degree'],config['seed'])
+
+
+def graph_options(config,generator,graph_cache,seed,spec = None):
+    '''
+    shared topology, or the generator and graph_cache and, without a sweep seed, the config seed as graph_seed
+    '''
+    if spec:
+        return {'topology': shared_topology.attach(spec)}
+    options = {'generator': generator,'graph_cache': graph_cache}
+    if seed is None:
+        options['graph_seed'] = config['seed']
+    return options
+
+
+def seed_options(config,seed):
+    '''
+    config['seed'] is the spawn key of the run under the sweep seed
+    '''
+    if seed is None:
+        return None
+    return {'seed': seed,'spawn_key': config['seed']}
+
+
+def build_topology(sweep_name,config,generator,graph_cache,seed):
+    '''
+    network of a configuration, from the graph stream of its seed alone, so it does not
+    depend on whether it was built here or in the worker with a graph_cache
+    '''
+    UG = UG_Complex_Network(config['node_num'],config['network_type'],config['update_rule'],config['player_type'],
+                            config['avg_degree'],run_dir(sweep_name,config),"csr",
+                            graph_options = graph_options(config,generator,graph_cache,seed),seed_options = seed_options(config,seed))
+    return UG.build_network()
+
+
+def train_one(task):
+    '''
+    run (or continue) one configuration of the sweep in a worker process
+    '''
+    sweep_name,config,Epochs,engine,generator,graph_cache,spec,early_stop,seed,threads = task
+    check_point = run_dir(sweep_name,config)
+    path = os.path.join("./result",check_point)
+    # the cores are shared by all workers, threads each
+    kernels.set_threads(threads)
+    engine_options = {'threads': threads} if engine == "threads" else None
+    if seed is None:
+        # no sweep seed, every run seeds the global streams with its own config seed
+        random.seed(config['seed'])
+        np.random.seed(config['seed'])
+    UG = UG_Complex_Network(config['node_num'],config['network_type'],config['update_rule'],config['player_type'],
+                            config['avg_degree'],check_point,engine,engine_options = engine_options,
+                            graph_options = graph_options(config,generator,graph_cache,seed,spec),
+                            seed_options = seed_options(config,seed),early_stop = early_stop)
+    if os.path.exists(path) and os.listdir(path):
+        G,Start = UG.retrain(check_point)
+    else:
+        os.makedirs(path,exist_ok = True)
+        Start = 1
+        G = UG.build_network()
+        UG.initialize_strategy(G)
+    t = time.time()
+    UG.train(G,Start,Epochs)
+    done = dict(config,Epochs = Epochs,engine = engine,seconds = time.time()-t,last_epoch = UG.last_epoch,
+                stop_reason = UG.stop_reason,seeds = UG.seeds.manifest() if UG.seeds is not None else None)
+    checkpoint.write_json(os.path.join(path,"done.json"),done)
+
+
+def run_one(task):
+    '''
+    train_one, an exception fails this run alone and is returned as (run name, traceback),
+    (run name, None) when the run finished
+    '''
+    try:
+        train_one(task)
+    except Exception:
+        return run_name(task[1]),traceback.format_exc()
+    return run_name(task[1]),None
+
+
+def sweep(grid,sweep_name,Epochs,engine = "csr",processes = None,graph_cache = None,share_topology = True,early_stop = None,seed = 0,
+          generator = "array"):
+    '''
+    run every configuration of the grid on a process pool,
+    runs that already finished are skipped, interrupted ones continue from their last check point.
+    networks are built by generator, "array" or "nx".
+    with a graph_cache directory, runs that differ only in update_rule or player_type
+    share one network per seed, built once and memory-mapped by every worker.
+    with share_topology (array engines) the runs of one network are queued together: the network is
+    built here and placed in shared memory just before, when a worker is free, and removed once they
+    have all finished. workers only allocate their own strategy and payoff arrays.
+    early_stop is passed on to UG_Complex_Network, done.json records where each run stopped.
+    the threads and numba engines get cpu_count // processes threads per run, not every core each.
+    a run that raises is reported and skipped, the others keep going; returns the names of the failed runs.
+    config['seed'] is the spawn key of a run under the sweep seed: its graph, strategy and dynamics
+    streams are spawned from SeedSequence(seed, (config['seed'],)), so concurrent runs are independent
+    and UG_Complex_Network(..., seed_options = {'seed': seed,'spawn_key': config['seed']}) repeats one on its own.
+    with seed None every run seeds random and np.random (and its graph) with config['seed'] instead
+    '''
+    if engine == "sharded":
+        # pool workers are daemonic and cannot start the shard processes
+        raise ValueError("the sharded engine cannot run inside sweep() workers, use csr, numba or threads")
+    configs = expand_grid(grid)
+    pending = [c for c in configs if not is_finished(sweep_name,c)]
+    print("{} runs, {} finished, {} pending".format(len(configs),len(configs)-len(pending),len(pending)))
+    if processes is None:
+        processes = os.cpu_count()
+    share = share_topology and engine != "nx"
+    threads = max(1,os.cpu_count()//processes)
+    # runs of each network, in grid order
+    groups = {}
+    for c in pending:
+        groups.setdefault(topology_key(c),[]).append(c)
+    # (topology key, run name, traceback or None) of finished runs, put by the pool's result thread
+    results = queue.Queue()
+    shared = {}
+    left = {}
+    failed = []
+    running = 0
+    def collect():
+        key,name,error = results.get()
+        if error is None:
+            print("finished: ",name)
+        else:
+            print("failed: ",name)
+            print(error)
+            failed.append(name)
+        left[key] -= 1
+        if left[key] == 0 and key in shared:
+            shared.pop(key).close()
+    try:
+        # networks are built while the pool starts new workers, spawned workers
+        # do not inherit locks held by this process's threads as forked ones would
+        with multiprocessing.get_context("spawn").Pool(processes,maxtasksperchild = 1) as pool:
+            for key,runs in groups.items():
+                # the next network is only built once a worker is free for its runs
+                while running >= processes:
+                    collect()
+                    running -= 1
+                spec = None
+                if share:
+                    shared[key] = shared_topology.SharedTopology(build_topology(sweep_name,runs[0],generator,graph_cache,seed))
+                    spec = shared[key].spec
+                    print("shared topology {}: {:.1f} MB".format(run_name(runs[0]),shared[key].nbytes()/2**20))
+                left[key] = len(runs)
+                for c in runs:
+                    task = (sweep_name,c,Epochs,engine,generator,graph_cache,spec,early_stop,seed,threads)
+                    pool.apply_async(run_one,(task,),callback = lambda result,key = key: results.put((key,)+result))
+                    running += 1
+            while running:
+                collect()
+                running -= 1
+    finally:
+        for s in shared.values():
+            s.close()
+    if failed:
+        print("{} runs failed: {}".format(len(failed),", ".join(failed)))
+    return failed
+
+
+if __name__ == '__main__':
+
+    grid = {
+        'network_type': ["SF","ER"],
+        'update_rule': ["NS","SP"],
+        'player_type': ["A","B","C"],
+        'avg_degree': [4],
+        'node_num': [10000],
+        'seed': list(range(10)), # spawn keys under the sweep seed
+    }
+    sweep_name = "ug_sweep"
+    Epochs = 21000
+    engine = "csr" #"nx, csr, numba or threads"
+    graph_cache = "./result/graph_cache" # None builds a new network for every run
+    early_stop = {'fixation': True,'adoption_window': 500} # None always runs all Epochs
+    seed = 0 # root of every run's seed streams
+    generator = "array" # "array" or "nx" networks
+    sweep(grid,sweep_name,Epochs,engine,graph_cache = graph_cache,early_stop = early_stop,seed = seed,generator = generator)
@@ -0,0 +1,135 @@
+"""
+Multi-threaded CSR engine with edge-balanced work partitioning for Ultimatum Game in complex network
+"""
+
+import concurrent.futures
+import os
+
+import numpy as np
+
+import counter_rng
+import csr_engine
+
+
+def edge_blocks(indptr,block_edges = 2**16):
+    '''
+    split the directed edge list into blocks of block_edges edges, a hub with more
+    edges than that is spread over several blocks. every block holds
+    (start, stop, local row starts for reduceat, rows fully inside the block and their
+    segments, rows cut by the block boundary and their segments)
+    '''
+    indptr = np.asarray(indptr,dtype = np.int64)
+    blocks = []
+    for start in range(0,int(indptr[-1]),block_edges):
+        stop = min(start + block_edges,int(indptr[-1]))
+        rows = np.arange(np.searchsorted(indptr,start,'right') - 1,np.searchsorted(indptr,stop,'left'))
+        rows = rows[indptr[rows+1] > indptr[rows]]
+        seg = np.maximum(indptr[rows],start) - start
+        inner = (indptr[rows] >= start) & (indptr[rows+1] <= stop)
+        blocks.append((start,stop,seg,rows[inner],np.nonzero(inner)[0],rows[~inner],np.nonzero(~inner)[0]))
+    return blocks
+
+
+class ThreadedEngine():
+    '''
+    csr_engine on a thread pool, same interface as the csr_engine and kernels modules.
+    play is partitioned by edges, not nodes: fixed-size edge blocks are handed to the
+    threads, so a few hubs of a scale-free network cannot leave most threads idle.
+    the NumPy calls on a block (np.take, comparisons, np.add.reduceat) release the GIL.
+    block sizes do not depend on the thread count, so neither does the result;
+    payoffs of rows summed within one block match csr_engine up to the last bits.
+    natural selection and social penalty are O(1) per node and split by node ranges,
+    with the same random draws and results as csr_engine
+    '''
+    def __init__(self,threads = None,block_edges = 2**16,block_nodes = 2**16):
+        self.threads = threads or os.cpu_count()
+        self.block_edges = block_edges
+        self.block_nodes = block_nodes
+        self.pool = concurrent.futures.ThreadPoolExecutor(self.threads)
+        self.indptr = None
+        self.blocks = None
+
+    def edge_blocks(self,net):
+        '''
+        edge partition of net, built once per topology
+        '''
+        if self.indptr is not net.indptr:
+            self.blocks = edge_blocks(net.indptr,self.block_edges)
+            self.indptr = net.indptr
+        return self.blocks
+
+    def node_ranges(self,net):
+        return [(lo,min(lo + self.block_nodes,net.node_num)) for lo in range(0,net.node_num,self.block_nodes)]
+
+    def synchronous_play(self,net):
+        '''
+        same rule as csr_engine.synchronous_play, edge blocks in parallel;
+        rows inside a block are written by its thread, the partial sums
+        of rows cut by block boundaries are added afterwards in block order
+        '''
+        gain = np.zeros(net.payoff.shape,dtype = net.payoff.dtype)
+        blocks = self.edge_blocks(net)
+
+        def play_block(block):
+            start,stop,seg,inner_rows,inner,outer_rows,outer = block
+            sums = np.add.reduceat(csr_engine.edge_gain(net.p,net.q,net.src[start:stop],net.indices[start:stop]),seg,axis = -1)
+            gain[...,inner_rows] = sums[...,inner]
+            return sums[...,outer]
+
+        for block,partial in zip(blocks,self.pool.map(play_block,blocks)):
+            gain[...,block[5]] += partial
+
+        def finish(node_range):
+            lo,hi = node_range
+            payoff = net.payoff[...,lo:hi]
+            payoff += gain[...,lo:hi]
+            degree = net.degree[lo:hi]
+            np.divide(payoff,degree,out = payoff,where = degree != 0)
+
+        list(self.pool.map(finish,self.node_ranges(net)))
+
+    def natural_selection(self,net,rng = None):
+        '''
+        csr_engine.natural_selection with the per-node work split over threads,
+        the random numbers are drawn up front in the same order
+        '''
+        shape = net.p.shape
+        u_nbr = csr_engine.uniform(rng,counter_rng.NBR,shape)
+        u_adopt = csr_engine.uniform(rng,counter_rng.ADOPT,shape)
+        # neighbour copied by every node, -1 for no adoption
+        src = np.empty(shape,dtype = np.int64)
+
+        def select(node_range):
+            lo,hi = node_range
+            degree = net.degree[lo:hi]
+            offset = np.minimum((u_nbr[...,lo:hi]*degree).astype(np.int64),np.maximum(degree-1,0))
+            chosen = np.take(net.indices,np.minimum(net.indptr[lo:hi] + offset,net.indices.size-1))
+            payoff_diff = np.take_along_axis(net.payoff,chosen,-1) - net.payoff[...,lo:hi]
+            probs_adopt = payoff_diff/(2*np.maximum(np.maximum(degree,np.take(net.degree,chosen)),1))
+            adopt = (degree > 0) & (payoff_diff > 0) & (u_adopt[...,lo:hi] < probs_adopt)
+            src[...,lo:hi] = np.where(adopt,chosen,-1)
+
+        list(self.pool.map(select,self.node_ranges(net)))
+        return csr_engine.apply_adoptions(net,src)
+
+    def natural_selection_sequential(self,net,rng = None):
+        return csr_engine.natural_selection_sequential(net,rng)
+
+    def lowest(self,net):
+        '''
+        np.argmin of the payoffs (per replica) as a parallel reduction:
+        the minimum of every node range, then the first range holding the overall minimum
+        '''
+        ranges = self.node_ranges(net)
+
+        def range_min(node_range):
+            lo,hi = node_range
+            i = np.argmin(net.payoff[...,lo:hi],axis = -1)
+            return np.take_along_axis(net.payoff[...,lo:hi],np.expand_dims(i,-1),-1)[...,0],i + lo
+
+        values,index = zip(*self.pool.map(range_min,ranges))
+        best = np.argmin(np.stack(values),axis = 0)
+        return np.take_along_axis(np.stack(index),np.expand_dims(best,0),0)[0]
+
+    def social_penalty(self,net,Type = 'B',rng = None):
+        return csr_engine.social_penalty(net,Type = Type,lowest_n = self.lowest(net),rng = rng)
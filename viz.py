@@ -9,22 +9,15 @@ import numpy as np
 import pandas as pd
 import os
 
+import pq_stats
 
-def pq_distribution(value_list):
-    x_axis = np.arange(0,1.05,1/20) # 21 descrete points,range 0~1,step size 0.05
-    y_axis = np.zeros(x_axis.size)
-    for v in value_list:
-        for i in range(x_axis.size):
-            if abs(v-x_axis[i]) < 0.05:
-                y_axis[i] += 1
-    return y_axis
 
 def viz(RecordName,time_option = "all"):
     # Epoch_list = ['1','100','1000','20000']
     Epoch_list = ['100','1000','20000']
     result_dir = "./result"
     record_dir = os.path.join(result_dir,RecordName)
-    checkpoint_list = os.listdir(record_dir)
+    checkpoint_list = [fn for fn in os.listdir(record_dir) if fn.split("_")[-1].isdigit()]
     parse_str = checkpoint_list[0].split("_")
     del(parse_str[-1])
     info_str = '_'.join(parse_str)
@@ -34,23 +27,30 @@ def viz(RecordName,time_option = "all"):
     for Epoch in Epoch_list:
         info_e = info_str+"_"+Epoch
         Epoch_dir = os.path.join(record_dir,info_e )
-        strategy_path = os.path.join(Epoch_dir,info_e+"_strategy.csv")
-        strategy = pd.read_csv(strategy_path)
-        # strategy.reset_index(drop = True)
-        pq_array = strategy.values
-        # np.delete(pq_array,1,axis=1)
-        p = pq_array[0][1:]
-        q = pq_array[1][1:]
+        state_path = os.path.join(Epoch_dir,info_e+"_state.npy")
+        if os.path.exists(state_path):
+            # binary check point: p, q, payoff of all nodes (of all replicas)
+            state = np.load(state_path,mmap_mode = 'r')
+            p = np.ravel(state[0])
+            q = np.ravel(state[1])
+        else:
+            strategy_path = os.path.join(Epoch_dir,info_e+"_strategy.csv")
+            strategy = pd.read_csv(strategy_path)
+            # strategy.reset_index(drop = True)
+            pq_array = strategy.values
+            # np.delete(pq_array,1,axis=1)
+            p = pq_array[0][1:]
+            q = pq_array[1][1:]
         # del(p[0])
         # del(q[0])
-        p = pq_distribution(p)
-        q = pq_distribution(q)
+        p = pq_stats.window_histogram(p)
+        q = pq_stats.window_histogram(q)
     
         y_axis_plist.append(p/10000)
         y_axis_qlist.append(q/10000)
 
     plt.figure()
-    x_axis = np.arange(0,1.05,1/20)
+    x_axis = pq_stats.x_axis
     # plt.rcParams['font.sans-serif']=['SimHei']
     # plt.rcParams['axes.unicode_minus'] = False
     # # plt.title("")